@@ -1,12 +1,15 @@
+import json
 import logging
-import time
 import threading
 import gradio as gr
 
-from src.router import hybrid_answer
-from src.model_cache import get_vectorstore, get_reranker, get_llm
-from src.official_store import load_official
-from config import OFFICIAL_DIR
+from src.router import hybrid_answer_stream_async
+from src.conversation import Conversation
+from src.precomputed import CARD_QUESTIONS
+from src.model_cache import warm_up, readiness
+from src.router import get_official_db
+from src.metrics import ROUTES, start_metrics_server
+from config import APP_PORT, METRICS_PORT, CHAT_CONCURRENCY_LIMIT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("dost-hybrid")
@@ -280,74 +283,56 @@ def ensure_messages(history):
 
 # ---------------------------
 # Chat logic:
-# - beating dot (pulse frames)
+# - stream tokens into the chat as they arrive
 # - disable input while thinking
+# - async end to end: no thread is held while waiting on the LLM
 # ---------------------------
-def chat_response(query, history):
+async def chat_response(query, history, conversation):
     history = ensure_messages(history)
+    # Per-session memory for follow-up questions (see src/conversation.py)
+    if conversation is None:
+        conversation = Conversation()
 
     if not query or not query.strip():
         # keep as-is
-        yield history, history, query, gr.update(interactive=True), gr.update(interactive=True)
+        yield history, history, query, gr.update(interactive=True), gr.update(interactive=True), conversation
         return
 
     user_text = query.strip()
 
     # Disable textbox + Ask button immediately
-    yield history, history, "", gr.update(interactive=False), gr.update(interactive=False)
+    yield history, history, "", gr.update(interactive=False), gr.update(interactive=False), conversation
 
     # Append user
     history.append({"role": "user", "content": user_text})
 
-    # Append assistant placeholder
+    # Append assistant placeholder (replaced by the first streamed token)
     history.append({"role": "assistant", "content": "●"})
-    yield history, history, "", gr.update(interactive=False), gr.update(interactive=False)
+    yield history, history, "", gr.update(interactive=False), gr.update(interactive=False), conversation
 
-    # Background compute
-    result = {"done": False, "answer": None, "error": None}
-
-    def worker():
-        try:
-            result["answer"] = hybrid_answer(user_text)
-        except Exception as e:
-            logger.exception(e)
-            result["error"] = e
-        finally:
-            result["done"] = True
-
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-
-    # Beating dot frames (pulse 느낌)
-    # You can tweak these for a different "beat"
-    frames = ["·", "●", "●●", "●●●", "●●", "●"]
-    i = 0
-
-    while not result["done"]:
-        history[-1] = {"role": "assistant", "content": frames[i % len(frames)]}
-        i += 1
-        yield history, history, "", gr.update(interactive=False), gr.update(interactive=False)
-        time.sleep(0.18)
+    answer = None
+    try:
+        async for answer in hybrid_answer_stream_async(user_text, conversation):
+            history[-1] = {"role": "assistant", "content": answer}
+            yield history, history, "", gr.update(interactive=False), gr.update(interactive=False), conversation
+    except Exception as e:
+        logger.exception(e)
+        answer = "Sorry, an error occurred."
 
-    answer = "Sorry, an error occurred." if result["error"] else (result["answer"] or "Sorry, I couldn't generate an answer.")
-    history[-1] = {"role": "assistant", "content": answer}
+    history[-1] = {"role": "assistant", "content": answer or "Sorry, I couldn't generate an answer."}
 
     # Re-enable textbox + Ask button after answering
-    yield history, history, "", gr.update(interactive=True), gr.update(interactive=True)
+    yield history, history, "", gr.update(interactive=True), gr.update(interactive=True), conversation
 
 
 def on_card_click(card_id):
-    questions = {
-        "tech-card": "Tell me about DOST's latest technologies and innovations.",
-        "programs-card": "What are the current DOST programs and projects?",
-        "services-card": "What services does DOST Region II offer?",
-    }
-    return questions.get(card_id, "")
+    # Answers to these are precomputed by build_index.py
+    return CARD_QUESTIONS.get(card_id, "")
 
 
 def clear_all():
-    # chat, state, textbox, textbox interactive, ask interactive
-    return [], [], "", gr.update(interactive=True), gr.update(interactive=True)
+    # chat, state, textbox, textbox interactive, ask interactive, conversation
+    return [], [], "", gr.update(interactive=True), gr.update(interactive=True), None
 
 
 # ---------------------------
@@ -408,22 +393,23 @@ with gr.Blocks(title="DOST Hybrid Chatbot") as gui:
             )
 
     state = gr.State([])
+    conversation = gr.State(None)
 
     # Ask + Enter:
-    # Outputs: chatbot, state, textbox(value), textbox(interactive), ask(interactive)
+    # Outputs: chatbot, state, textbox(value), textbox(interactive), ask(interactive), conversation
     ask.click(
         chat_response,
-        inputs=[q, state],
-        outputs=[chatbot, state, q, q, ask],
+        inputs=[q, state, conversation],
+        outputs=[chatbot, state, q, q, ask, conversation],
     )
     q.submit(
         chat_response,
-        inputs=[q, state],
-        outputs=[chatbot, state, q, q, ask],
+        inputs=[q, state, conversation],
+        outputs=[chatbot, state, q, q, ask, conversation],
     )
 
     # Clear:
-    clear.click(clear_all, outputs=[chatbot, state, q, q, ask])
+    clear.click(clear_all, outputs=[chatbot, state, q, q, ask, conversation])
 
     # Hidden buttons for card -> fill textbox
     tech_btn = gr.Button("Tech Button", visible=False, elem_id="tech-btn")
@@ -487,27 +473,34 @@ with gr.Blocks(title="DOST Hybrid Chatbot") as gui:
         )
 
 
-if __name__ == "__main__":
-    print("Loading models (may take a while on first run)...")
-    try:
-        get_vectorstore()
-        print("✓ Vectorstore loaded")
-        get_reranker()
-        print("✓ Reranker loaded")
-        get_llm()
-        print("✓ LLM loaded")
-        load_official(OFFICIAL_DIR)
-        print("✓ Official database loaded")
-        print("All models ready! Starting server...")
-    except Exception as e:
-        print(f"Warning: Error preloading models: {e}")
-        print("Models will load on first request (slower first response)")
+def _readyz():
+    state = readiness()
+    return (200 if state["ready"] else 503), json.dumps(state) + "\n"
 
-    gui.queue()
+
+if __name__ == "__main__":
+    # Liveness/readiness live next to /metrics so the load balancer can wait
+    # until the models are warm before sending traffic.
+    if METRICS_PORT:
+        ROUTES["/healthz"] = lambda: (200, "ok\n")
+        ROUTES["/readyz"] = _readyz
+        start_metrics_server(METRICS_PORT)
+
+    # Load embeddings + FAISS, BM25, CrossEncoder, LLM client and the official
+    # DB in parallel, each warmed with a dummy call, while the UI starts.
+    print("Warming up models in the background (may take a while on first run)...")
+    threading.Thread(
+        target=warm_up,
+        kwargs={"extra": {"official_db": get_official_db}},
+        name="warmup",
+        daemon=True,
+    ).start()
+
+    gui.queue(default_concurrency_limit=CHAT_CONCURRENCY_LIMIT)
 
     gui.launch(
         server_name="0.0.0.0",
-        server_port=7860,
+        server_port=APP_PORT,
         share=False,
         theme=APP_THEME,
         css=APP_CSS,
@@ -1,8 +1,38 @@
+import sys
 import logging
-from config import DOCS_DIR, INDEX_DIR
-from src.ingest import build_or_update_index
+from config import DOCS_DIR, INDEX_DIR, EVAL_QUERIES_FILE
 
-logging.basicConfig(level=logging.INFO)
+def main(args):
+    # Imported here, not at the top: spawned extraction workers re-import
+    # this script and must not load torch and the models with it
+    from src.ingest import build_or_update_index, index_report, precompute_card_answers
 
-build_or_update_index(DOCS_DIR, INDEX_DIR)
-print("Index built successfully.")
+    if "--report" in args:
+        # Compare FAISS index types (see FAISS_INDEX_TYPE in config.py) on the
+        # held-out questions in EVAL_QUERIES_FILE; needs an existing index.
+        queries = [q.strip() for q in EVAL_QUERIES_FILE.read_text(encoding="utf-8").splitlines() if q.strip()]
+        print(f"{'type':<8} {'recall@6':>9} {'ms/query':>9} {'size KB':>9}")
+        for row in index_report(INDEX_DIR, queries):
+            print(f"{row['index_type']:<8} {row['recall']:>9.3f} {row['latency_ms']:>9.3f} {row['bytes'] / 1024:>9.1f}")
+        return
+
+    # Pass --rebuild to ignore the existing index and start from scratch.
+    stats = build_or_update_index(DOCS_DIR, INDEX_DIR, rebuild="--rebuild" in args)
+    print(f"Files reprocessed: {stats['processed']}, skipped (unchanged): {stats['skipped']}, "
+          f"failed: {stats['failed']}, removed: {stats['removed']}, chunks embedded: {stats['chunks_added']}")
+
+    # Answers for the quick cards come from the LLM; pass --no-cards to skip
+    # (FAQ answers are always stored with the index). A failure here leaves
+    # those questions to the normal pipeline.
+    if "--no-cards" not in args:
+        try:
+            print(f"Card answers precomputed: {precompute_card_answers(INDEX_DIR)}")
+        except Exception as e:
+            logging.warning(f"Could not precompute card answers (is Ollama running?): {e}")
+    print("Index built successfully.")
+
+# Extraction workers are spawned processes that re-import this module as
+# __mp_main__: the build must only run in the parent.
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
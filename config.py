@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent
@@ -6,16 +7,160 @@ DOCS_DIR = ROOT / "data" / "public_docs"
 OFFICIAL_DIR = ROOT / "data" / "official"
 INDEX_DIR = ROOT / "storage" / "faiss_index"
 
+# Seconds between checks for edited JSON files in OFFICIAL_DIR; changed
+# datasets are reloaded without a restart. 0 disables reloading.
+OFFICIAL_RELOAD_INTERVAL = 5
+
 OLLAMA_MODEL = "mistral"
 LLM_TEMPERATURE = 0.1  # lower = less hallucination
 
+# Ollama client (src/ollama_client.py). Ollama unloads a model OLLAMA_KEEP_ALIVE
+# after its last request ("30m"; -1 keeps it loaded until Ollama stops); while
+# the app idles it is pinged every OLLAMA_KEEP_WARM_INTERVAL seconds (None
+# disables) so nobody waits for a cold load. None options use Ollama's default.
+OLLAMA_BASE_URL = os.environ.get("DOST_OLLAMA_URL", "http://127.0.0.1:11434")
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_KEEP_WARM_INTERVAL = 600
+OLLAMA_NUM_CTX = 2048  # prompt + answer; the context is capped at CONTEXT_TOKEN_BUDGET
+OLLAMA_NUM_PREDICT = 384  # longest answer, in tokens
+OLLAMA_NUM_THREAD = None
+# Per request: connect timeout, then at most LLM_REQUEST_TIMEOUT seconds
+# between received bytes. Failed requests are retried LLM_RETRIES times with
+# backoff LLM_RETRY_BACKOFF * 2**attempt (streams only before the first token).
+LLM_CONNECT_TIMEOUT = 3
+LLM_REQUEST_TIMEOUT = 120
+LLM_RETRIES = 2
+LLM_RETRY_BACKOFF = 0.5
+
 RETRIEVE_K = 6  # Reduced from 8 for faster retrieval (still good quality)
 RERANK_TOP_K = 2  # Reduced from 3 for faster reranking (still good quality)
 
-# FAISS "distance" threshold (lower is better). Currently unused in gating.
+# FAISS "distance" threshold (lower is better). Hits farther than this are
+# dropped before reranking; if nothing is left, the general prompt is used.
 MAX_FAISS_DIST = 1.0
 
+# Skip the CrossEncoder when the best FAISS hit beats the runner-up by at
+# least this much distance: reranking would not change the winner.
+RERANK_SKIP_MARGIN = 0.25
+
 # If True, run a second-pass verifier (slower + stricter).
 # We disable it by default to avoid overly frequent refusals like
 # "I don’t have enough information to answer that."
 ENABLE_VERIFY = False
+
+# Semantic answer cache in front of RAG (see src/answer_cache.py).
+# A query whose embedding has cosine similarity >= ANSWER_CACHE_MIN_SIM with a
+# cached query reuses that answer. Entries expire after ANSWER_CACHE_TTL seconds.
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_TTL = 3600
+ANSWER_CACHE_MIN_SIM = 0.92
+
+# Document extraction during index builds (src/ingest.py).
+# Files are partitioned in a pool of EXTRACT_WORKERS processes (1 = serial);
+# a file taking longer than EXTRACT_TIMEOUT seconds is skipped.
+EXTRACT_WORKERS = 2
+EXTRACT_TIMEOUT = 300
+
+# Embedding stage of index builds: chunks are embedded EMBED_BATCH_SIZE at a
+# time and cached on disk by chunk hash, so text unchanged since the previous
+# build is not embedded again. After each build the cache keeps only the
+# current chunks' vectors.
+EMBED_BATCH_SIZE = 64
+EMBED_CACHE_DIR = ROOT / "storage" / "embedding_cache"
+
+# Rerank micro-batching: concurrent requests' (query, chunk) pairs are
+# collected for up to RERANK_MAX_WAIT_MS (or until RERANK_MAX_BATCH pairs)
+# and scored in a single CrossEncoder.predict call.
+RERANK_BATCHING = True
+RERANK_MAX_WAIT_MS = 10
+RERANK_MAX_BATCH = 64
+
+# CrossEncoder scores of recent (query, chunk) pairs are kept in an LRU of
+# RERANK_CACHE_SIZE entries, so repeated questions skip the model. Candidates
+# whose terms are RERANK_DEDUP_MIN_OVERLAP contained in a better-ranked one
+# (the same text in two formats of a brochure) are dropped before scoring.
+RERANK_CACHE_SIZE = 4096
+RERANK_DEDUP_MIN_OVERLAP = 0.8
+# Reranker backend: "torch" (default), "onnx" or "onnx-int8" (quantized ONNX,
+# fastest on CPU; needs sentence-transformers>=4.1 with the [onnx] extra).
+RERANKER_BACKEND = "torch"
+RERANKER_ONNX_INT8_FILE = "onnx/model_qint8_avx512.onnx"
+
+# Hybrid retrieval: BM25 (built next to the FAISS index) and FAISS results are
+# merged with reciprocal rank fusion before reranking. Exact terms (service
+# names, equipment codes, fee items) are found by BM25, so fewer fused
+# candidates need to go through the CrossEncoder. BM25 hits are only added
+# when some FAISS hit is within MAX_FAISS_DIST, which stays the relevance gate.
+HYBRID_RETRIEVAL = True
+BM25_K = 8
+RRF_K = 60
+RERANK_CANDIDATES = 5
+
+# Prometheus metrics (per-stage/per-route latency, cache hit rates, queue
+# depth) are served at http://<host>:METRICS_PORT/metrics, along with
+# /healthz (liveness) and /readyz (503 until models are warm). None disables it.
+# When several app.py workers share a host, give each its own ports through
+# DOST_APP_PORT / DOST_METRICS_PORT (see README, "Multiple workers").
+APP_PORT = int(os.environ.get("DOST_APP_PORT", 7860))
+METRICS_PORT = int(os.environ.get("DOST_METRICS_PORT", 9100))
+# A component whose warmup failed (Ollama not up yet, ...) is retried in the
+# background every WARMUP_RETRY_INTERVAL seconds until it loads; /readyz turns
+# 200 as soon as all components are ready.
+WARMUP_RETRY_INTERVAL = 10
+
+# Async serving: FAISS search, BM25, embeddings and CrossEncoder calls run in
+# a bounded thread pool of this size; the event loop never blocks on them.
+ASYNC_EXECUTOR_WORKERS = 4
+# Chat turns Gradio runs at once (Gradio's own default is 1)
+CHAT_CONCURRENCY_LIMIT = 32
+
+# Admission control for Ollama: at most LLM_MAX_CONCURRENT generations run at
+# once and at most LLM_MAX_QUEUE wait for a slot, each for up to
+# LLM_QUEUE_TIMEOUT seconds. Requests beyond that are shed: they get a cached
+# answer (similarity >= ANSWER_CACHE_SHED_SIM), an official-store answer, or
+# a short "busy" reply.
+LLM_MAX_CONCURRENT = 2
+LLM_MAX_QUEUE = 8
+LLM_QUEUE_TIMEOUT = 20
+ANSWER_CACHE_SHED_SIM = 0.8
+
+# Prompt context budget (approximate tokens, ~4 characters each). Sentences
+# from the retrieved chunks are picked by rerank score and query overlap
+# until the budget is used; overlapping text is included only once.
+CONTEXT_TOKEN_BUDGET = 450
+
+# FAQ questions and the quick-card questions are answered at index build time
+# (see src/precomputed.py). A query containing every content word of a stored
+# question, and overlapping it by at least this much (Jaccard), gets the
+# stored answer.
+PRECOMPUTED_MIN_OVERLAP = 0.75
+
+# Multi-turn chat (see src/conversation.py): the earlier questions (not the
+# answers) are passed to the LLM, trimmed to HISTORY_TOKEN_BUDGET tokens; a question of at
+# most FOLLOW_UP_MAX_TOKENS words that refers back ("how much is that?") is
+# treated as a follow-up of the previous one.
+HISTORY_TOKEN_BUDGET = 60
+FOLLOW_UP_MAX_TOKENS = 8
+
+# Embedding model backend shared by index builds and queries:
+# "torch" (default), "onnx" or "onnx-int8" (quantized ONNX, fastest on CPU;
+# needs sentence-transformers[onnx]). Changing it re-embeds the corpus.
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_INT8_FILE = "onnx/model_qint8_avx512.onnx"
+# Recent query embeddings kept in memory (LRU)
+EMBED_QUERY_CACHE_SIZE = 1024
+
+# FAISS index type built by build_index.py: "flat" (exact), "hnsw", "sq8"
+# (8-bit scalar quantization), "ivf", "ivfsq8" or "ivfpq" (product
+# quantization, smallest). Types that need more training vectors than the
+# corpus has fall back to a simpler one. Search-time knobs:
+FAISS_INDEX_TYPE = "flat"
+FAISS_NPROBE = 8  # IVF lists probed per query
+FAISS_HNSW_EF_SEARCH = 64
+# Index builds are published as versions (see src/vector_index.py). Running
+# workers check for a newer one at most every INDEX_RELOAD_INTERVAL seconds
+# and swap it in without a restart; the newest INDEX_KEEP_VERSIONS are kept.
+INDEX_RELOAD_INTERVAL = 5
+INDEX_KEEP_VERSIONS = 2
+# Held-out questions for the recall/latency report (python build_index.py --report)
+EVAL_QUERIES_FILE = ROOT / "data" / "eval_queries.txt"
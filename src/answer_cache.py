@@ -0,0 +1,118 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", query.lower())).strip()
+
+def files_fingerprint(paths: List[Path]) -> Tuple:
+    """(name, mtime, size) for each path; changes whenever any file is rewritten."""
+    fp = []
+    for p in paths:
+        try:
+            st = p.stat()
+            fp.append((str(p), st.st_mtime_ns, st.st_size))
+        except OSError:
+            fp.append((str(p), None, None))
+    return tuple(fp)
+
+class SemanticAnswerCache:
+    """
+    LRU + TTL cache of final answers keyed on the normalized query and its
+    embedding. An exact normalized match is served without embedding; any
+    other query is embedded and compared (cosine) against cached queries.
+
+    fingerprint() is called on every lookup; when its value changes (index
+    rebuilt, official JSON edited) the whole cache is dropped.
+    """
+
+    def __init__(self, embed: Callable[[str], List[float]], fingerprint: Callable[[], Tuple],
+                 max_size: int, ttl: float, min_similarity: float):
+        self._embed = embed
+        self._fingerprint = fingerprint
+        self.max_size = max_size
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self._entries = OrderedDict()  # normalized query -> (unit vector, answer, created)
+        self._lock = threading.Lock()
+        self._current_fp = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _unit(self, query: str) -> np.ndarray:
+        vec = np.asarray(self._embed(query), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _check_fresh(self) -> None:
+        fp = self._fingerprint()
+        if fp != self._current_fp:
+            self._entries.clear()
+            self._current_fp = fp
+
+    def _expire(self, now: float) -> None:
+        stale = [k for k, (_, _, created) in self._entries.items() if now - created > self.ttl]
+        for k in stale:
+            del self._entries[k]
+
+    def get(self, query: str, min_similarity: Optional[float] = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Return (answer, query_vector). answer is None on a miss; the vector
+        (when computed) can be passed back to put() to avoid re-embedding.
+        min_similarity overrides the configured threshold for this lookup.
+        """
+        if min_similarity is None:
+            min_similarity = self.min_similarity
+        key = normalize_query(query)
+        with self._lock:
+            self._check_fresh()
+            self._expire(time.time())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][1], None
+            if not self._entries:
+                self.misses += 1
+                return None, None
+            keys = list(self._entries)
+            matrix = np.stack([self._entries[k][0] for k in keys])
+
+        vec = self._unit(query)
+        sims = matrix @ vec
+        best = int(np.argmax(sims))
+
+        with self._lock:
+            entry = self._entries.get(keys[best])
+            if entry is not None and sims[best] >= min_similarity:
+                self._entries.move_to_end(keys[best])
+                self.hits += 1
+                return entry[1], vec
+            self.misses += 1
+        return None, vec
+
+    def put(self, query: str, answer: str, vec: Optional[np.ndarray] = None) -> None:
+        key = normalize_query(query)
+        if vec is None:
+            vec = self._unit(query)
+        with self._lock:
+            self._check_fresh()
+            self._entries[key] = (vec, answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,75 @@
+import os
+import json
+import mmap
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Files written next to index.faiss; together they replace the pickled
+# docstore (index.pkl) of FAISS.save_local.
+TEXTS_NAME = "chunks.bin"        # UTF-8 chunk texts, back to back
+OFFSETS_NAME = "chunks.offsets.npy"  # int64 byte offsets, n + 1 entries
+META_NAME = "chunks.json"        # {"ids": [...], "metadatas": [...]}
+
+def write_chunk_store(store_dir: Path, ids: List[str], docs: List[Document]) -> None:
+    """Write docs (row i = FAISS vector i) in the chunk store format."""
+    store_dir.mkdir(parents=True, exist_ok=True)
+    encoded = [d.page_content.encode("utf-8") for d in docs]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    tmp = store_dir / (TEXTS_NAME + ".tmp")
+    with open(tmp, "wb") as f:
+        for b in encoded:
+            f.write(b)
+    os.replace(tmp, store_dir / TEXTS_NAME)
+
+    tmp = store_dir / (OFFSETS_NAME + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, offsets)
+    os.replace(tmp, store_dir / OFFSETS_NAME)
+
+    tmp = store_dir / (META_NAME + ".tmp")
+    tmp.write_text(json.dumps({"ids": ids, "metadatas": [d.metadata for d in docs]}), encoding="utf-8")
+    os.replace(tmp, store_dir / META_NAME)
+
+def has_chunk_store(store_dir: Path) -> bool:
+    return all((store_dir / n).exists() for n in (TEXTS_NAME, OFFSETS_NAME, META_NAME))
+
+class ChunkStore:
+    """
+    Read-only docstore over the chunk store files. Texts and offsets are
+    memory-mapped, so every process serving the same index shares one copy
+    in the page cache; only ids and metadata are loaded into memory.
+    Implements the search() method FAISS needs from a docstore.
+    """
+
+    def __init__(self, store_dir: Path):
+        meta = json.loads((store_dir / META_NAME).read_text(encoding="utf-8"))
+        self.ids: List[str] = meta["ids"]
+        self._metadatas: List[Dict[str, Any]] = meta["metadatas"]
+        self._rows = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(store_dir / OFFSETS_NAME, mmap_mode="r")
+        with open(store_dir / TEXTS_NAME, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, row: int) -> Document:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return Document(id=self.ids[row], page_content=self._texts[start:end].decode("utf-8"),
+                        metadata=dict(self._metadatas[row]))
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.get(row)
+
+    def documents(self) -> Iterator[Document]:
+        for row in range(len(self.ids)):
+            yield self.get(row)
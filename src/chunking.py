@@ -0,0 +1,108 @@
+import re
+from typing import Any, Dict, List
+
+from langchain_core.documents import Document
+
+from src.extraction import HEADING_MARKS
+
+# Tables up to this size stay one chunk, whatever the chunk size; longer ones
+# are split by rows and every piece repeats the header row.
+TABLE_MAX_CHARS = 2000
+# Text this short right before a table is kept with it
+CAPTION_MAX_CHARS = 200
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _sentences(text: str, size: int) -> List[str]:
+    """Sentences of text; any longer than size are cut at whitespace."""
+    out = []
+    for sent in _SENTENCE_END.split(text):
+        while len(sent) > size:
+            cut = sent.rfind(" ", 0, size)
+            cut = cut if cut > 0 else size
+            out.append(sent[:cut])
+            sent = sent[cut:].lstrip()
+        if sent:
+            out.append(sent)
+    return out
+
+def _split_table(text: str, size: int) -> List[str]:
+    if len(text) <= size:
+        return [text]
+    lines = text.splitlines()
+    head_len = 2 if len(lines) > 1 and set(lines[1].replace(" ", "")) <= set("|-:") else 1
+    head, rows = lines[:head_len], lines[head_len:]
+    pieces, current = [], list(head)
+    for row in rows:
+        if len(current) > head_len and sum(len(l) + 1 for l in current) + len(row) > size:
+            pieces.append("\n".join(current))
+            current = list(head)
+        current.append(row)
+    pieces.append("\n".join(current))
+    return pieces
+
+def _tail(text: str, overlap: int) -> str:
+    # Trailing whole sentences of at most overlap characters, verbatim so the
+    # context builder can merge neighbouring chunks again
+    for m in _SENTENCE_END.finditer(text):
+        if len(text) - m.end() <= overlap:
+            return text[m.end():]
+    return ""
+
+def chunk_blocks(blocks: List[Dict[str, Any]], source: str, chunk_size: int, overlap: int) -> List[Document]:
+    """
+    Group blocks into chunks along the document structure. A title starts a
+    new section; text blocks are packed into chunks of at most chunk_size
+    characters, consecutive chunks of a section sharing up to overlap
+    characters of whole sentences; each table is its own chunk (split by rows
+    only beyond TABLE_MAX_CHARS). Every chunk starts with its section title
+    and carries {"source", "section", "page", "kind"} metadata.
+    """
+    docs: List[Document] = []
+    section = ""
+    buf, buf_page = "", None
+    carried = False  # buf holds only the overlap from the previous chunk
+    block_start = None  # where the last text block starts in buf, if all of it is there
+
+    def emit(text: str, page, kind: str) -> None:
+        content = f"{section}\n{text}" if section and not text.startswith(section) else text
+        docs.append(Document(page_content=content,
+                             metadata={"source": source, "section": section, "page": page, "kind": kind}))
+
+    def flush(carry: bool) -> None:
+        nonlocal buf, buf_page, carried, block_start
+        block_start = None
+        if buf and not carried:
+            emit(buf, buf_page, "text")
+            buf = _tail(buf, overlap) if carry else ""
+        else:
+            buf = ""
+        carried = bool(buf)
+        buf_page = last_page if buf else None
+
+    last_page = None
+    for block in blocks:
+        kind, text, page = block["kind"], block["text"], block.get("page")
+        if kind == "title":
+            flush(carry=False)
+            section = HEADING_MARKS.sub("", text)[:200]
+        elif kind == "table":
+            # A short last block before the table ("Packages:") is its caption
+            caption = ""
+            if block_start is not None and not carried and len(buf) - block_start < CAPTION_MAX_CHARS:
+                buf, caption = buf[:block_start].rstrip("\n"), buf[block_start:]
+            flush(carry=False)
+            for piece in _split_table(text, TABLE_MAX_CHARS):
+                emit(f"{caption}\n{piece}" if caption else piece, page, "table")
+        else:
+            sep = "\n"  # between blocks; sentences of one block are joined by a space
+            for sent in _sentences(text, chunk_size):
+                if buf and len(buf) + 1 + len(sent) > chunk_size:
+                    flush(carry=True)
+                if sep == "\n":
+                    block_start = len(buf) + 1 if buf else 0
+                buf = f"{buf}{sep}{sent}" if buf else sent
+                buf_page = buf_page or page
+                last_page, carried, sep = page, False, " "
+    flush(carry=False)
+    return docs
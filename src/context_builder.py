@@ -0,0 +1,123 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.text_index import STOPWORDS, tokenize
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+# Shortest suffix/prefix match treated as splitter overlap between two chunks
+MIN_OVERLAP = 20
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about 4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+def _overlap(a: str, b: str, max_len: int = 400) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if < MIN_OVERLAP)."""
+    for n in range(min(len(a), len(b), max_len), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+def _label(meta: Dict[str, Any]) -> str:
+    # "[Source: ...]" header text: file, page and section when known
+    parts = [meta.get("source", "unknown")]
+    if meta.get("page"):
+        parts.append(f"p. {meta['page']}")
+    if meta.get("section"):
+        parts.append(meta["section"])
+    return ", ".join(parts)
+
+def merge_passages(docs: List, weights: List[float]) -> List[Tuple[str, str, float, str]]:
+    """
+    Merge chunks of the same source and section that overlap (consecutive
+    chunks share a few sentences) into one passage. The section title each
+    chunk starts with is moved to the passage label.
+    Returns (source, text, weight, label) with the best weight of the merged chunks.
+    """
+    passages: List[List[Any]] = []  # [source, text, weight, label, section]
+    for d, w in zip(docs, weights):
+        src = d.metadata.get("source", "unknown")
+        section = d.metadata.get("section") or ""
+        text = d.page_content.strip()
+        if section and text.startswith(section + "\n"):
+            text = text[len(section) + 1:]
+        for p in passages:
+            if p[0] != src or p[4] != section:
+                continue
+            if text in p[1]:
+                p[2] = max(p[2], w)
+                break
+            n = _overlap(p[1], text)
+            if n:
+                p[1], p[2] = p[1] + text[n:], max(p[2], w)
+                break
+            n = _overlap(text, p[1])
+            if n:
+                p[1], p[2] = text + p[1][n:], max(p[2], w)
+                break
+        else:
+            passages.append([src, text, w, _label(d.metadata), section])
+    return [tuple(p[:4]) for p in passages]
+
+def _weights(n: int, scores: Optional[List[float]]) -> List[float]:
+    # Rerank scores min-max scaled to [0.5, 1]; without scores, by rank
+    if not scores:
+        return [1.0 / (1 + i) for i in range(n)]
+    lo, hi = min(scores), max(scores)
+    return [0.5 + 0.5 * ((s - lo) / (hi - lo) if hi > lo else 1.0) for s in scores]
+
+def pack_context(query: str, docs: List, scores: Optional[List[float]] = None,
+                 budget: int = 450) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Build the prompt context from ranked docs within a token budget.
+
+    Overlapping chunks of the same source are merged, repeated sentences
+    dropped, and sentences are chosen by passage weight (rerank score) plus
+    their overlap with the query terms (the line after a match gets half its
+    boost). Chosen sentences keep their original
+    order under one [Source: ...] header per passage; rows picked from a
+    table always come with its header row.
+    """
+    passages = merge_passages(docs, _weights(len(docs), scores))
+    q_terms = {t for t in tokenize(query) if t not in STOPWORDS}
+
+    candidates = []  # (priority, passage, position, sentence)
+    table_heads = {}  # passage -> (position, header row)
+    seen = set()
+    for pi, (_, text, weight, _) in enumerate(passages):
+        prev_match = 0.0
+        for si, sent in enumerate(s.strip() for s in _SENTENCE_SPLIT.split(text)):
+            if sent.startswith("|") and pi not in table_heads:
+                table_heads[pi] = (si, sent)
+            key = " ".join(tokenize(sent))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            terms = set(key.split())
+            match = len(q_terms & terms) / len(q_terms) if q_terms else 0.0
+            # The line after a matching one is often its answer (FAQ Q -> A)
+            candidates.append((weight + match + 0.5 * prev_match, pi, si, sent))
+            prev_match = match
+
+    chosen = {}
+    used = 0
+    for priority, pi, si, sent in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+        cost = estimate_tokens(sent) + 1
+        if chosen and used + cost > budget:
+            continue
+        chosen[(pi, si)] = sent
+        used += cost
+    # A table row means little without its column names
+    for pi, (si, head) in table_heads.items():
+        if any(k[0] == pi for k in chosen):
+            chosen[(pi, si)] = head
+
+    blocks, sources = [], []
+    for pi, (src, _, _, label) in enumerate(passages):
+        picked = [chosen[k] for k in sorted(chosen) if k[0] == pi]
+        if not picked:
+            continue
+        blocks.append(f"[Source: {label}]\n" + "\n".join(picked))
+        if {"source": src} not in sources:
+            sources.append({"source": src})
+    return "\n\n".join(blocks), sources
@@ -0,0 +1,116 @@
+import re
+from typing import Any, List, Optional, Tuple
+
+from config import HISTORY_TOKEN_BUDGET, FOLLOW_UP_MAX_TOKENS
+from src.context_builder import estimate_tokens
+from src.rag_engine import is_small_talk
+from src.text_index import STOPWORDS, tokenize
+
+# A follow-up must say that it refers back. Ellipsis ("what about the
+# fees?", "what about microbiology?") may name a topic of its own; an anaphor
+# ("how much is it?") must bring no topic words of its own, or ordinary
+# questions that happen to contain "that" would be rewritten.
+ELLIPSIS_PATTERN = re.compile(r"^\s*(?:what|how)\s+about\b", re.IGNORECASE)
+ANAPHORS = frozenset("it its that this those these them they same".split())
+_FOLLOW_UP_WORDS = ANAPHORS | frozenset(
+    "there about also and much many long else more please po ok okay tell know explain".split()
+)
+# Words asking about an aspect of the same topic ("how much does it cost?",
+# "what are its requirements?"); they do not make an anaphor question new
+ASPECT_WORDS = frozenset("""
+cost costs price prices fee fees rate rates charge charges pay payment apply
+application requirements requirement needed need schedule open
+hours contact email phone number address where located location available
+offer offered process processing take takes duration days
+""".split())
+# Topic words carried over from the last standalone question
+MAX_CARRIED_TERMS = 8
+
+def _topic_terms(text: str) -> List[str]:
+    seen = []
+    for t in tokenize(text):
+        if t not in STOPWORDS and t not in _FOLLOW_UP_WORDS and t not in seen:
+            seen.append(t)
+    return seen
+
+class Turn:
+    """
+    One question in a Conversation. standalone is used for routing, the
+    answer cache and retrieval; history lists earlier questions for the
+    prompt; reuse holds the previous turn's (doc, score) pairs when they
+    still cover the question. docs is filled with what was actually used.
+    """
+
+    def __init__(self, query: str, standalone: str, history: str,
+                 reuse: Optional[List[Tuple[Any, Optional[float]]]] = None):
+        self.query = query
+        self.standalone = standalone
+        self.history = history
+        self.reuse = reuse
+        self.docs: List[Tuple[Any, Optional[float]]] = []
+
+class Conversation:
+    """
+    Per-session memory for multi-turn chat. A follow-up that names no topic
+    of its own is rewritten into a standalone query by adding the topic words
+    of the last question that was not itself a follow-up, so a chain of
+    follow-ups does not drift; one that does ("what about GIA?") starts a new
+    topic. No LLM call is spent on it. When a follow-up asks nothing beyond
+    the topic and aspect words ("how much does it cost?"), the previous
+    turn's retrieved chunks are reused instead of searching again.
+
+    Only the questions are kept, not the answers: the earlier questions
+    (trimmed to HISTORY_TOKEN_BUDGET, so the prompt does not grow with the
+    chat) tell the LLM what the client is after, while earlier answers would
+    cost prompt tokens and invite the model to repeat them instead of using
+    the retrieved context.
+    """
+
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.questions: List[str] = []  # as typed, oldest first
+        self.topic: List[str] = []       # topic words of the last standalone question
+        self.last: Optional[Turn] = None
+
+    def is_follow_up(self, query: str) -> bool:
+        if self.last is None or not self.topic or is_small_talk(query):
+            return False
+        tokens = tokenize(query)
+        if len(tokens) > FOLLOW_UP_MAX_TOKENS:
+            return False
+        if ELLIPSIS_PATTERN.match(query):
+            return True
+        return bool(ANAPHORS.intersection(tokens)) and all(
+            t in self.topic or t in ASPECT_WORDS for t in _topic_terms(query))
+
+    def earlier_questions(self) -> str:
+        return "; ".join(self.questions)
+
+    def begin(self, query: str) -> Turn:
+        if not self.is_follow_up(query):
+            if not is_small_talk(query):
+                self.topic = _topic_terms(query)[:MAX_CARRIED_TERMS]
+            return Turn(query, query, self.earlier_questions())
+
+        new_terms = _topic_terms(query)
+        own_topic = [t for t in new_terms if t not in self.topic and t not in ASPECT_WORDS]
+        if own_topic:
+            # "What about GIA?": a different subject, the old topic would only
+            # pull retrieval back to it
+            self.topic = own_topic[:MAX_CARRIED_TERMS]
+            return Turn(query, query, self.earlier_questions())
+        standalone = " ".join([query] + [t for t in self.topic if t not in new_terms])
+
+        # Nothing new asked: the chunks found for the topic still apply
+        reuse = self.last.docs or None
+        return Turn(query, standalone, self.earlier_questions(), reuse)
+
+    def end(self, turn: Turn) -> None:
+        """Record a finished turn; drops the oldest questions beyond the budget."""
+        self.last = turn
+        self.questions.append(turn.query)
+        while len(self.questions) > 1 and estimate_tokens(self.earlier_questions()) > self.token_budget:
+            self.questions.pop(0)
+        if estimate_tokens(self.earlier_questions()) > self.token_budget:
+            # A single over-long question: keep its tail
+            self.questions = [self.questions[0][-4 * self.token_budget:]]
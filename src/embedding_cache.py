@@ -0,0 +1,136 @@
+import json
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    On-disk chunk-hash -> vector cache used by the index builder.
+
+    Layout in cache_dir:
+      meta.json    {"model": ..., "dim": ...}; a different model resets the cache
+      keys.txt     one chunk hash per line; line i is row i of vectors.f32
+      vectors.f32  raw float32 rows, memory-mapped read-only for lookups
+
+    New vectors are appended, so adding to a large cache never rewrites it.
+    """
+
+    def __init__(self, cache_dir: Path, model_name: str):
+        self.cache_dir = Path(cache_dir)
+        self.model_name = model_name
+        self.dim = None
+        self._rows = {}  # hash -> row
+        self._n = 0  # rows in the files (a hash added twice has two)
+        self._vectors = None
+        self._load()
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.cache_dir / "meta.json"
+
+    @property
+    def _keys_path(self) -> Path:
+        return self.cache_dir / "keys.txt"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.cache_dir / "vectors.f32"
+
+    def _load(self) -> None:
+        if not self._meta_path.exists():
+            return
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable embedding cache {self.cache_dir}: {e}")
+            return
+        if meta.get("model") != self.model_name:
+            logger.info(f"Embedding model changed; discarding cache in {self.cache_dir}")
+            return
+        self.dim = int(meta["dim"])
+        text = self._keys_path.read_text(encoding="utf-8") if self._keys_path.exists() else ""
+        keys = text.split("\n")[:-1]  # a last line without newline was cut off
+        size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        # An interrupted append can leave keys without vectors (or vice versa).
+        # Cut both files back to the rows they share, so the next append
+        # starts at row n in each.
+        n = min(len(keys), size // (4 * self.dim))
+        if n != len(keys) or n * 4 * self.dim != size or len(text) != sum(len(k) + 1 for k in keys):
+            logger.warning(f"Embedding cache {self.cache_dir} was cut off mid-write; keeping {n} rows")
+            self._keys_path.write_text("".join(k + "\n" for k in keys[:n]), encoding="utf-8")
+            if self._vectors_path.exists():
+                os.truncate(self._vectors_path, n * 4 * self.dim)
+        self._rows = {k: i for i, k in enumerate(keys[:n])}
+        self._n = n
+        self._map(n)
+
+    def _map(self, n: int) -> None:
+        if n:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        else:
+            self._vectors = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def lookup(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        return {h: np.array(self._vectors[self._rows[h]]) for h in hashes if h in self._rows}
+
+    def add(self, hashes: List[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(hashes):
+            return
+        if self.dim is None or not self._n:
+            self._reset(vectors.shape[1])
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._keys_path, "a", encoding="utf-8") as f:
+            f.write("".join(h + "\n" for h in hashes))
+        for i, h in enumerate(hashes):
+            self._rows[h] = self._n + i
+        self._n += len(hashes)
+        self._map(self._n)
+
+    def _reset(self, dim: int) -> None:
+        self.dim = dim
+        self._rows = {}
+        self._n = 0
+        self._vectors = None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for p in (self._keys_path, self._vectors_path):
+            if p.exists():
+                p.unlink()
+        self._meta_path.write_text(json.dumps({"model": self.model_name, "dim": dim}), encoding="utf-8")
+
+    def compact(self, keep: Iterable[str]) -> int:
+        """Drop vectors whose hash is not in keep. Returns how many were dropped."""
+        keep_rows = sorted(self._rows[h] for h in set(keep) if h in self._rows)
+        dropped = self._n - len(keep_rows)
+        if not dropped:
+            return 0
+        keys_by_row = {i: h for h, i in self._rows.items()}
+        kept_keys = [keys_by_row[i] for i in keep_rows]
+        kept_vectors = np.array(self._vectors[keep_rows], dtype=np.float32) if keep_rows else np.zeros((0, self.dim), np.float32)
+        self._vectors = None
+
+        tmp_vectors = self._vectors_path.with_suffix(".tmp")
+        tmp_keys = self._keys_path.with_suffix(".tmp")
+        tmp_vectors.write_bytes(kept_vectors.tobytes())
+        tmp_keys.write_text("".join(h + "\n" for h in kept_keys), encoding="utf-8")
+        os.replace(tmp_vectors, self._vectors_path)
+        os.replace(tmp_keys, self._keys_path)
+
+        self._rows = {h: i for i, h in enumerate(kept_keys)}
+        self._n = len(kept_keys)
+        self._map(self._n)
+        return dropped
@@ -0,0 +1,94 @@
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Runs in the extraction worker processes (see ingest.extract_files), which
+# import only this module: keep it free of torch, sentence-transformers and
+# langchain so a spawned worker does not load the ML stack.
+from unstructured.partition.auto import partition
+
+# Page furniture that would only add noise to every chunk
+_SKIP_CATEGORIES = {"Header", "Footer", "PageBreak", "PageNumber"}
+_WORD = re.compile(r"\w")
+HEADING_MARKS = re.compile(r"^#{1,6}\s+")
+
+class _TableRows(HTMLParser):
+    # Rows of cell texts from unstructured's text_as_html
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[str]] = []
+        self._cell: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.rows.append([])
+        elif tag in ("td", "th"):
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            if not self.rows:
+                self.rows.append([])
+            self.rows[-1].append(" ".join("".join(self._cell).split()))
+            self._cell = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+def _markdown_table(html: str) -> Optional[str]:
+    parser = _TableRows()
+    parser.feed(html)
+    rows = [r for r in parser.rows if any(r)]
+    if not rows:
+        return None
+    lines = ["| " + " | ".join(r) + " |" for r in rows]
+    lines.insert(1, "|" + "---|" * len(rows[0]))
+    return "\n".join(lines)
+
+def _is_markdown_table(text: str) -> bool:
+    lines = text.strip().splitlines()
+    return len(lines) > 1 and all(l.lstrip().startswith("|") for l in lines)
+
+def element_blocks(elements) -> List[Dict[str, Any]]:
+    """
+    unstructured elements -> picklable blocks {"text", "kind", "page"} where
+    kind is "title", "table" or "text". Tables are rendered as markdown rows
+    (from text_as_html when available) so row/column structure survives.
+    """
+    blocks = []
+    for el in elements:
+        text = (getattr(el, "text", None) or "").strip()
+        category = getattr(el, "category", "")
+        # No word characters: rules ("---"), bullets, page ornaments
+        if not _WORD.search(text) or category in _SKIP_CATEGORIES:
+            continue
+        meta = getattr(el, "metadata", None)
+        page = getattr(meta, "page_number", None)
+        if category == "Table":
+            html = getattr(meta, "text_as_html", None)
+            kind, text = "table", (_markdown_table(html) if html else None) or text
+        elif _is_markdown_table(text):
+            kind = "table"
+        elif category == "Title" or (HEADING_MARKS.match(text) and "\n" not in text):
+            kind = "title"
+        else:
+            kind = "text"
+        blocks.append({"text": text, "kind": kind, "page": page})
+    return blocks
+
+def extract_blocks(file_path: Path) -> List[Dict[str, Any]]:
+    # "fast" keeps PDFs on the text layer: table inference would switch them
+    # to the hi_res layout models (plus poppler), which the image does not
+    # ship. DOCX tables carry text_as_html either way.
+    elements = partition(filename=str(file_path), strategy="fast")
+    return element_blocks(elements)
+
+def extract_worker(file_path: Path) -> Tuple[Path, Optional[List[Dict[str, Any]]], Optional[str]]:
+    # Runs in a pool process; errors are returned, not raised, so the parent
+    # knows which file failed.
+    try:
+        return file_path, extract_blocks(file_path), None
+    except Exception as e:
+        return file_path, None, f"{type(e).__name__}: {e}"
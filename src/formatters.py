@@ -1,10 +1,11 @@
 import re
 from typing import List, Dict, Any
 
+UNIT_PATTERN = re.compile(r"\b(per piece|per hour|per L|per kg|per ton)\b", re.IGNORECASE)
+
 def format_money_and_units(text: str) -> str:
     # Keep this conservative—avoid aggressive number rewriting
-    text = re.sub(r"\b(per piece|per hour|per L|per kg|per ton)\b", r"*\1*", text, flags=re.IGNORECASE)
-    return text
+    return UNIT_PATTERN.sub(r"*\1*", text)
 
 def format_sources(sources: List[Dict[str, Any]]) -> str:
     if not sources:
@@ -0,0 +1,128 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager, contextmanager
+
+from src.metrics import REGISTRY, register_gauge
+
+logger = logging.getLogger(__name__)
+
+class GenerationOverloaded(Exception):
+    """Raised when no generation slot can be granted (queue full or wait timed out)."""
+
+class GenerationGate:
+    """
+    Bounded concurrency for LLM generation, usable from threads and asyncio.
+
+    At most max_concurrent callers hold a slot; up to max_queue more wait in
+    FIFO order for at most timeout seconds. Anyone beyond that, or anyone
+    who times out, gets GenerationOverloaded so the caller can shed load.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, timeout: float, name: str = "generation"):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def is_saturated(self) -> bool:
+        """True when a new request would be rejected immediately."""
+        with self._lock:
+            return self._active >= self.max_concurrent and len(self._waiters) >= self.max_queue
+
+    def _enter(self) -> Future:
+        fut = Future()
+        with self._lock:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                fut.set_result(True)
+            elif len(self._waiters) >= self.max_queue:
+                REGISTRY.inc("dost_generation_rejected_total", "reason", "queue_full")
+                raise GenerationOverloaded("generation queue is full")
+            else:
+                self._waiters.append(fut)
+        return fut
+
+    def _withdraw(self, fut: Future) -> bool:
+        """Leave the queue; False if the slot was already granted to fut."""
+        with self._lock:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+                return True
+            return False
+
+    def _timed_out(self, fut: Future) -> None:
+        if self._withdraw(fut):
+            REGISTRY.inc("dost_generation_rejected_total", "reason", "timeout")
+            raise GenerationOverloaded(f"no {self.name} slot within {self.timeout}s")
+        # The slot was handed over just as we timed out: keep it
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the next waiter
+                self._waiters.popleft().set_result(True)
+            else:
+                self._active -= 1
+
+    def _record_wait(self, waited: float) -> None:
+        REGISTRY.observe("dost_stage_latency_seconds", "stage", f"{self.name}_queue_wait", waited)
+        if waited >= 0.01:
+            logger.info(f"Waited {waited:.2f}s for a {self.name} slot")
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the block; yields seconds spent queued."""
+        start = time.perf_counter()
+        fut = self._enter()
+        try:
+            fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._timed_out(fut)
+        waited = time.perf_counter() - start
+        self._record_wait(waited)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Async slot(): waits on the event loop instead of blocking a thread."""
+        start = time.perf_counter()
+        fut = self._enter()
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(fut)
+        except asyncio.CancelledError:
+            # Client went away while queued: give back whatever we got
+            if not self._withdraw(fut):
+                self._release()
+            raise
+        waited = time.perf_counter() - start
+        self._record_wait(waited)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+REGISTRY.help["dost_generation_rejected_total"] = "LLM generations refused by admission control"
+
+def register_gate_gauges(gate: GenerationGate) -> None:
+    register_gauge(f"dost_{gate.name}_active", f"{gate.name} slots in use", lambda: gate.active)
+    register_gauge(f"dost_{gate.name}_queue_depth", f"Requests waiting for a {gate.name} slot", lambda: gate.queue_depth)
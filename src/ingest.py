@@ -1,48 +1,329 @@
 import os
+import json
+import time
+import queue
+import hashlib
 import logging
+import multiprocessing
 from pathlib import Path
-from typing import List
+from typing import List, Dict, Any, Iterator, Tuple, Optional
 
-from unstructured.partition.auto import partition
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import faiss
+import numpy as np
+
+from config import EXTRACT_WORKERS, EXTRACT_TIMEOUT, EMBED_BATCH_SIZE, EMBED_CACHE_DIR, FAISS_INDEX_TYPE
+from src.embedding_cache import EmbeddingCache, chunk_hash
+from src.text_index import BM25Index
+from src.model_cache import get_embeddings
+from src.chunking import chunk_blocks
+from src.extraction import extract_worker
+from src.chunk_store import ChunkStore, write_chunk_store, has_chunk_store
+from src.precomputed import CARD_QUESTIONS, faq_entries, load_entries, save_precomputed
+from src.vector_index import (
+    INDEX_TYPES, build_faiss_index, save_faiss_index, evaluate_index,
+    current_index_dir, new_version_dir, publish_version,
+)
 
 logger = logging.getLogger(__name__)
 
-def extract_text(file_path: Path) -> str:
-    elements = partition(filename=str(file_path))
-    return "\n".join([el.text for el in elements if getattr(el, "text", None)])
+# Characters per text chunk. Tables are kept whole (see src/chunking.py), so
+# text chunks can stay small and dense.
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 80
+# Bump when chunk_blocks changes how documents are cut, to force a rebuild
+CHUNKER_VERSION = 2
+
+# Stored next to index.faiss and the chunk store. Records, per source file, the
+# content hash and the docstore IDs of its chunks so unchanged files can be skipped.
+MANIFEST_NAME = "manifest.json"
+
+# Lexical index over the same chunks, used for hybrid retrieval
+BM25_NAME = "bm25.json"
+
+def extract_files(paths: List[Path], workers: int = EXTRACT_WORKERS,
+                  timeout: float = EXTRACT_TIMEOUT) -> Iterator[Tuple[Path, Optional[List[Dict[str, Any]]], Optional[str]]]:
+    """
+    Extract structural blocks (see extraction.element_blocks) from paths in a
+    pool of worker processes and yield (path, blocks, error) as each file
+    finishes. blocks is None when extraction failed or exceeded timeout; error
+    says why. At most `workers` files are in flight, so only a handful of
+    extracted documents are held in memory at once.
+    """
+    if workers <= 1:
+        for fp in paths:
+            yield extract_worker(fp)
+        return
+
+    # spawn: the parent may already hold torch/tokenizer threads, which do
+    # not survive fork safely. Workers only import src.extraction (and the
+    # main script, see build_index.py), not the ML stack.
+    ctx = multiprocessing.get_context("spawn")
+    done = queue.Queue()
+    pending = list(paths)
+    pool = ctx.Pool(workers)
+    in_flight = {}  # path -> deadline
+    hung = 0
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) + hung < workers:
+                fp = pending.pop(0)
+                in_flight[fp] = time.monotonic() + timeout
+                pool.apply_async(extract_worker, (fp,), callback=done.put)
+
+            wait = max(0.0, min(in_flight.values()) - time.monotonic())
+            try:
+                fp, blocks, error = done.get(timeout=wait)
+            except queue.Empty:
+                now = time.monotonic()
+                for fp in [p for p, deadline in in_flight.items() if deadline <= now]:
+                    del in_flight[fp]
+                    hung += 1
+                    yield fp, None, f"timed out after {timeout}s"
+                if hung >= workers and not in_flight:
+                    # Every worker is stuck on a bad file: start a fresh pool.
+                    pool.terminate()
+                    pool = ctx.Pool(workers)
+                    hung = 0
+                continue
+            if fp in in_flight:
+                del in_flight[fp]
+                yield fp, blocks, error
+            else:
+                # Late result of a timed-out file: dropped, but its worker is free again.
+                hung -= 1
+    finally:
+        if hung:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+def embed_chunks(texts: List[str], embeddings, cache: EmbeddingCache,
+                 batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
+    """
+    Embed chunk texts with the shared EmbeddingService, reusing cached vectors
+    by chunk hash. Uncached texts are embedded batch_size at a time,
+    L2-normalized once and added to the cache. Returns one vector per input
+    text, in order.
+    """
+    hashes = [chunk_hash(t) for t in texts]
+    vectors = cache.lookup(hashes)
+    missing = {}
+    for h, t in zip(hashes, texts):
+        if h not in vectors:
+            missing.setdefault(h, t)
+
+    start = time.perf_counter()
+    todo = list(missing.items())
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i + batch_size]
+        batch_vecs = embeddings.embed_batch([t for _, t in batch], batch_size)
+        cache.add([h for h, _ in batch], batch_vecs)
+        vectors.update(zip((h for h, _ in batch), batch_vecs))
+    elapsed = time.perf_counter() - start
+
+    rate = f"{len(todo) / elapsed:.1f} chunks/sec" if todo and elapsed else "n/a"
+    logger.info(f"Embedded {len(todo)} chunk(s) in {elapsed:.2f}s ({rate}); "
+                f"{len(texts) - len(todo)} reused")
+    return [vectors[h].tolist() for h in hashes]
+
+def file_hash(file_path: Path) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _index_settings(embeddings) -> Dict[str, Any]:
+    # If any of these change, every stored chunk is stale.
+    return {"embedding_model": embeddings.model_id, "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP, "chunker": CHUNKER_VERSION}
+
+def load_manifest(index_dir: Path) -> Dict[str, Any]:
+    path = index_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+def _save_manifest(index_dir: Path, files: Dict[str, Any], settings: Dict[str, Any], index_type: str) -> None:
+    manifest = {"settings": settings, "index_type": index_type, "files": files}
+    (index_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+def save_bm25(ids: List[str], texts: List[str], index_dir: Path) -> None:
+    """Build a BM25 index over the chunk texts and save it as JSON."""
+    data = {"ids": ids, "index": BM25Index(texts).to_dict()}
+    tmp = index_dir / (BM25_NAME + ".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, index_dir / BM25_NAME)
+
+def _list_docs(docs_dir: Path) -> List[str]:
+    return sorted(f for f in os.listdir(docs_dir) if f.lower().endswith((".pdf", ".docx", ".txt")))
 
-def build_or_update_index(docs_dir: Path, index_dir: Path) -> None:
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+def build_or_update_index(docs_dir: Path, index_dir: Path, rebuild: bool = False,
+                          workers: int = EXTRACT_WORKERS, timeout: float = EXTRACT_TIMEOUT,
+                          batch_size: int = EMBED_BATCH_SIZE, cache_dir: Path = EMBED_CACHE_DIR,
+                          index_type: str = FAISS_INDEX_TYPE) -> Dict[str, int]:
+    """
+    Build the FAISS index, or update it when a manifest from a previous build
+    exists: only new/changed files are extracted and embedded, chunks of
+    unchanged files are read back from the chunk store and everything else is
+    dropped. rebuild=True ignores the existing index.
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1200, chunk_overlap=150,
-        separators=["\n### ", "\n## ", "\n# ", "\n\n", "\n", " "],
-        is_separator_regex=False
-    )
+    Extraction runs in a process pool (see extract_files). A file that fails
+    or times out is skipped; if an earlier version of it is indexed, that
+    version is kept. Chunks are embedded through embed_chunks, so text that
+    was in the previous build is not embedded again. The cache is then
+    compacted to the current chunks: text edited away and later restored is
+    embedded anew. The FAISS index itself (index_type, see
+    src/vector_index.py) is rebuilt from those vectors on every change, which
+    keeps quantized/IVF types trained on the whole corpus.
 
-    all_docs = []
-    for fname in os.listdir(docs_dir):
-        if not fname.lower().endswith((".pdf", ".docx", ".txt")):
+    Returns counts: {"skipped", "processed", "failed", "removed", "chunks_added"}.
+    """
+    embeddings = get_embeddings()
+    settings = _index_settings(embeddings)
+    cache = EmbeddingCache(cache_dir, embeddings.model_id)
+
+    live_dir = current_index_dir(index_dir)
+    manifest = {} if rebuild else load_manifest(live_dir)
+    old_store = None
+    old_files = {}
+    if manifest.get("settings") == settings and has_chunk_store(live_dir):
+        old_store = ChunkStore(live_dir)
+        old_files = manifest.get("files", {})
+    elif manifest:
+        # Also covers indexes saved by FAISS.save_local (pickled index.pkl)
+        logger.info("Index settings or format changed; rebuilding from scratch")
+
+    stats = {"skipped": 0, "processed": 0, "failed": 0, "removed": 0, "chunks_added": 0}
+    new_files = {}
+    new_docs = {}
+
+    current = _list_docs(docs_dir)
+    for fname in set(old_files) - set(current):
+        logger.info(f"Removed: {fname}")
+        stats["removed"] += 1
+
+    digests = {}
+    for fname in current:
+        digest = file_hash(docs_dir / fname)
+        old = old_files.get(fname)
+        if old and old["sha256"] == digest:
+            new_files[fname] = old
+            stats["skipped"] += 1
+        else:
+            digests[fname] = digest
+
+    to_extract = [docs_dir / fname for fname in digests]
+    logger.info(f"Extracting {len(to_extract)} file(s) with {workers} worker(s)")
+    for fp, blocks, error in extract_files(to_extract, workers, timeout):
+        fname = fp.name
+        old = old_files.get(fname)
+        if error:
+            logger.error(f"Extraction failed for {fp}: {error}")
+            stats["failed"] += 1
+            if old:
+                new_files[fname] = old
             continue
-        fp = docs_dir / fname
-        logger.info(f"Extracting: {fp}")
-        text = extract_text(fp).strip()
-        if not text:
+
+        logger.info(f"Extracted: {fp}")
+        stats["processed"] += 1
+        digest = digests[fname]
+        chunk_docs = chunk_blocks(blocks, fname, CHUNK_SIZE, CHUNK_OVERLAP)
+        if not chunk_docs:
             logger.warning(f"No text extracted from: {fp}")
+            new_files[fname] = {"sha256": digest, "chunk_ids": [], "chunk_hashes": []}
             continue
 
-        # create_documents supports metadatas -> attach source filename
-        chunk_docs = splitter.create_documents([text], metadatas=[{"source": fname}])
-        all_docs.extend(chunk_docs)
+        ids = [f"{fname}:{digest[:16]}:{i}" for i in range(len(chunk_docs))]
+        new_files[fname] = {
+            "sha256": digest,
+            "chunk_ids": ids,
+            "chunk_hashes": [chunk_hash(d.page_content) for d in chunk_docs],
+        }
+        new_docs.update(zip(ids, chunk_docs))
 
-    if not all_docs:
+    kept = sum(len(f["chunk_ids"]) for f in new_files.values())
+    if not kept:
         raise ValueError("No documents were extracted. Add PDFs/DOCX/TXT to data/public_docs.")
 
-    # Build FAISS from Documents (keep metadata)
-    vectorstore = FAISS.from_documents(all_docs, embeddings)
-    index_dir.mkdir(parents=True, exist_ok=True)
-    vectorstore.save_local(str(index_dir))
-    logger.info(f"Saved FAISS index to: {index_dir}")
+    if (old_store is not None and not stats["processed"] and not stats["removed"]
+            and manifest.get("index_type") == index_type and (live_dir / BM25_NAME).exists()):
+        logger.info(f"Index is up to date: {live_dir}")
+        return stats
+
+    # Row i of the FAISS index is chunk i of the chunk store
+    all_ids, all_docs = [], []
+    for fname in sorted(new_files):
+        for doc_id in new_files[fname]["chunk_ids"]:
+            doc = new_docs.get(doc_id) or old_store.search(doc_id)
+            all_ids.append(doc_id)
+            all_docs.append(doc)
+
+    texts = [d.page_content for d in all_docs]
+    vectors = np.asarray(embed_chunks(texts, embeddings, cache, batch_size), dtype=np.float32)
+    index = build_faiss_index(vectors, index_type)
+    stats["chunks_added"] = len(new_docs)
+
+    cache.compact(chunk_hash(t) for t in texts)
+
+    # Write a complete new version, then switch to it in one step; running
+    # app.py workers pick it up without a restart.
+    version_dir = new_version_dir(index_dir)
+    save_faiss_index(index, version_dir)
+    write_chunk_store(version_dir, all_ids, all_docs)
+    save_bm25(all_ids, texts, version_dir)
+    save_precomputed(version_dir, faq_entries(docs_dir))
+    _save_manifest(version_dir, new_files, settings, index_type)
+    publish_version(index_dir, version_dir)
+    logger.info(f"Published FAISS index: {version_dir}")
+    return stats
+
+def index_report(index_dir: Path, queries: List[str], k: int = 6,
+                 cache_dir: Path = EMBED_CACHE_DIR) -> List[Dict[str, Any]]:
+    """
+    Build every FAISS index type over the chunks in index_dir and measure
+    recall@k against exact search for the given held-out queries, plus
+    per-query latency and index size. Chunk vectors come from the embedding
+    cache, so this only embeds the queries.
+    """
+    embeddings = get_embeddings()
+    cache = EmbeddingCache(cache_dir, embeddings.model_id)
+    texts = [d.page_content for d in ChunkStore(current_index_dir(index_dir)).documents()]
+    base = np.asarray(embed_chunks(texts, embeddings, cache), dtype=np.float32)
+    query_vecs = np.asarray(embeddings.embed_batch(queries), dtype=np.float32)
+
+    rows = []
+    for index_type in INDEX_TYPES:
+        index = build_faiss_index(base, index_type)
+        size = len(faiss.serialize_index(index))
+        rows.append({"index_type": index_type, "bytes": size, **evaluate_index(index, base, query_vecs, k)})
+    return rows
+
+def precompute_card_answers(index_dir: Path, force: bool = False) -> int:
+    """
+    Generate answers for the quick-card questions with the full RAG pipeline
+    (needs Ollama) and add them to the live index's precomputed answers.
+    Skipped when the live version already has them, unless force. Returns the
+    number of answers generated.
+    """
+    # Imported here: the pipeline is only needed for this step, not for builds
+    from src.rag_engine import rag_answer
+    from src.formatters import format_sources
+
+    live_dir = current_index_dir(index_dir)
+    entries = load_entries(live_dir)
+    if not force and any(e["kind"] == "card" for e in entries):
+        return 0
+
+    cards = []
+    for question in CARD_QUESTIONS.values():
+        answer, sources = rag_answer(question)
+        cards.append({"kind": "card", "question": question, "answer": answer + "\n" + format_sources(sources)})
+        logger.info(f"Precomputed answer for: {question}")
+    save_precomputed(live_dir, [e for e in entries if e["kind"] != "card"] + cards)
+    return len(cards)
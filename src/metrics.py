@@ -0,0 +1,190 @@
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Quantiles are computed over the most recent samples of each series
+WINDOW = 2048
+
+class Summary:
+    """Latency series: total count/sum plus quantiles over a sliding window."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self._window = deque(maxlen=WINDOW)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self._window.append(value)
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self._window)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.summaries: Dict[Tuple[str, str, str], Summary] = {}
+        self.help: Dict[str, str] = {}
+        self.counters: Dict[Tuple[str, str, str], float] = {}
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def observe(self, name: str, label: str, value_label: str, seconds: float) -> None:
+        with self._lock:
+            key = (name, label, value_label)
+            if key not in self.summaries:
+                self.summaries[key] = Summary()
+            self.summaries[key].observe(seconds)
+
+    def inc(self, name: str, label: str = "", value_label: str = "", amount: float = 1.0) -> None:
+        with self._lock:
+            key = (name, label, value_label)
+            self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, str, str], Dict[str, float]]:
+        """{(name, label, value): {"count", "sum", "p50", "p95", "p99"}} for every summary."""
+        with self._lock:
+            items = list(self.summaries.items())
+        out = {}
+        for key, s in items:
+            row = {"count": s.count, "sum": s.sum}
+            row.update({f"p{int(q * 100)}": v for q, v in s.quantiles().items()})
+            out[key] = row
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self.summaries.clear()
+            self.counters.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            summaries = sorted(self.summaries.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+
+        seen = set()
+        for (name, label, value), s in summaries:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} summary")
+            for q, v in s.quantiles().items():
+                lines.append(f'{name}{{{label}="{value}",quantile="{q}"}} {v:.6f}')
+            lines.append(f'{name}_sum{{{label}="{value}"}} {s.sum:.6f}')
+            lines.append(f'{name}_count{{{label}="{value}"}} {s.count}')
+
+        for (name, label, value), total in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            labels = f'{{{label}="{value}"}}' if label else ""
+            lines.append(f"{name}{labels} {total:g}")
+
+        for name, (help_text, fn) in gauges:
+            try:
+                value = float(fn())
+            except Exception:
+                logger.exception(f"Gauge {name} failed")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = _Registry()
+REGISTRY.help.update({
+    "dost_stage_latency_seconds": "Latency of one pipeline stage",
+    "dost_request_latency_seconds": "End-to-end answer latency per route",
+    "dost_time_to_first_token_seconds": "Time until the first streamed text per route",
+    "dost_requests_total": "Answered requests per route",
+})
+
+class timed(ContextDecorator):
+    """
+    Time a block (or, used as a decorator, a function) into
+    dost_stage_latency_seconds{stage=...}.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call, so concurrent calls don't share _start
+        return timed(self.stage)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe("dost_stage_latency_seconds", "stage", self.stage, time.perf_counter() - self._start)
+        return False
+
+def record_request(route: str, total: float, ttft: Optional[float] = None) -> None:
+    REGISTRY.observe("dost_request_latency_seconds", "route", route, total)
+    if ttft is not None:
+        REGISTRY.observe("dost_time_to_first_token_seconds", "route", route, ttft)
+    REGISTRY.inc("dost_requests_total", "route", route)
+
+def register_gauge(name: str, help_text: str, fn: Callable[[], float]) -> None:
+    """Expose fn() as a gauge; it is called on every scrape."""
+    with REGISTRY._lock:
+        REGISTRY.gauges[name] = (help_text, fn)
+
+class InFlight:
+    """Counts requests currently being answered (exported as a gauge)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.value += 1
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.value -= 1
+        return False
+
+requests_in_flight = InFlight()
+register_gauge("dost_requests_in_flight", "Requests currently being answered", lambda: requests_in_flight.value)
+
+# Extra plain-text endpoints served next to /metrics: path -> () -> (status, body)
+ROUTES: Dict[str, Callable[[], Tuple[int, str]]] = {
+    "/metrics": lambda: (200, REGISTRY.render()),
+}
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        route = ROUTES.get(self.path.split("?", 1)[0])
+        status, body = route() if route else (404, "not found\n")
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the log
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ROUTES (including /metrics) from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return server
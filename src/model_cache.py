@@ -1,35 +1,319 @@
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaLLM
 from sentence_transformers import CrossEncoder
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from config import INDEX_DIR, OLLAMA_MODEL, LLM_TEMPERATURE
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from config import (
+    INDEX_DIR, INDEX_RELOAD_INTERVAL, OLLAMA_MODEL, LLM_TEMPERATURE,
+    OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_KEEP_WARM_INTERVAL,
+    OLLAMA_NUM_CTX, OLLAMA_NUM_PREDICT, OLLAMA_NUM_THREAD,
+    LLM_CONNECT_TIMEOUT, LLM_REQUEST_TIMEOUT, LLM_RETRIES, LLM_RETRY_BACKOFF,
+    WARMUP_RETRY_INTERVAL,
+    LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT,
+    EMBEDDING_BACKEND, EMBEDDING_ONNX_INT8_FILE, EMBED_QUERY_CACHE_SIZE, EMBED_BATCH_SIZE,
+    RERANKER_BACKEND, RERANKER_ONNX_INT8_FILE,
+)
+from src.text_index import BM25Index
+from src.metrics import timed, register_gauge
+from src.generation_gate import GenerationGate, register_gate_gauges
+from src.ollama_client import OllamaClient
+from src.chunk_store import has_chunk_store
+from src.vector_index import open_vectorstore, current_index_dir
+from src.precomputed import PRECOMPUTED_NAME, PrecomputedAnswers, load_entries
+from src.answer_cache import files_fingerprint
 
-# Global cache for models - loaded once, reused forever
-_vectorstore = None
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+class EmbeddingService(Embeddings):
+    """
+    The one MiniLM instance per process, shared by the index builder, FAISS
+    queries and the answer cache. Query embeddings are kept in an LRU cache;
+    documents are embedded in batches. backend "onnx"/"onnx-int8" runs the
+    model through ONNX Runtime (int8 = quantized weights) instead of torch.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch",
+                 query_cache_size: int = 1024, batch_size: int = 64):
+        model_kwargs = {}
+        if backend == "onnx":
+            model_kwargs = {"backend": "onnx"}
+        elif backend == "onnx-int8":
+            model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": EMBEDDING_ONNX_INT8_FILE}}
+        elif backend != "torch":
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self._model = HuggingFaceEmbeddings(
+            model_name=model_name, model_kwargs=model_kwargs, encode_kwargs={"batch_size": batch_size},
+        )
+        # Identifies the vectors this service produces (index manifest, embedding cache)
+        self.model_id = model_name if backend == "torch" else f"{model_name}@{backend}"
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self.query_hits = 0
+        self.query_misses = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vec = self._queries.get(text)
+            if vec is not None:
+                self._queries.move_to_end(text)
+                self.query_hits += 1
+                return vec
+            self.query_misses += 1
+        vec = self._model.embed_query(text)
+        with self._lock:
+            self._queries[text] = vec
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return vec
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._model.embed_documents(texts)
+
+    def embed_batch(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Embed texts batch_size at a time into one L2-normalized float32 array."""
+        batch_size = batch_size or self.batch_size
+        out = []
+        for i in range(0, len(texts), batch_size):
+            out.append(np.asarray(self._model.embed_documents(texts[i:i + batch_size]), dtype=np.float32))
+        vecs = np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True) if len(vecs) else 1
+        return vecs / np.where(norms == 0, 1, norms)
+
+# Every LLM call goes through this gate (see src/generation_gate.py)
+llm_gate = GenerationGate(LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
+register_gate_gauges(llm_gate)
+
+# Global cache for models - loaded once, reused forever.
+# Each has its own lock so concurrent first requests load it only once,
+# while different models can still load in parallel.
+_embeddings = None
+_index = None  # (version dir, vectorstore, bm25, precomputed, stamp), see _current_index
+_index_checked = 0.0
 _reranker = None
 _llm = None
 
+_embeddings_lock = threading.Lock()
+_index_lock = threading.Lock()
+_reranker_lock = threading.Lock()
+_llm_lock = threading.Lock()
+
+def get_embeddings() -> EmbeddingService:
+    """Get the shared EmbeddingService. Loads on first call."""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                with timed("load_embeddings"):
+                    _embeddings = EmbeddingService(
+                        EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBED_QUERY_CACHE_SIZE, EMBED_BATCH_SIZE,
+                    )
+    return _embeddings
+
+def _query_embedding_hit_rate() -> float:
+    if _embeddings is None:
+        return 0.0
+    lookups = _embeddings.query_hits + _embeddings.query_misses
+    return _embeddings.query_hits / lookups if lookups else 0.0
+
+register_gauge("dost_query_embedding_cache_hit_ratio", "Share of query embeddings served from the LRU cache",
+               _query_embedding_hit_rate)
+
+def _load_index(path: Path):
+    embeddings = get_embeddings()
+    if has_chunk_store(path):
+        vectorstore = open_vectorstore(path, embeddings)
+    else:
+        logger.warning("Loading a pickled FAISS index; run build_index.py to convert it")
+        vectorstore = FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization=True)
+    bm25 = None
+    if (path / "bm25.json").exists():
+        data = json.loads((path / "bm25.json").read_text(encoding="utf-8"))
+        bm25 = (data["ids"], BM25Index.from_dict(data["index"]))
+    return (path, vectorstore, bm25) + _load_precomputed(path)
+
+def _load_precomputed(path: Path):
+    # (answers, file stamp); card answers are added to a published version
+    # after the fact, so the stamp is checked on its own
+    stamp = files_fingerprint([path / PRECOMPUTED_NAME])
+    return PrecomputedAnswers(load_entries(path)), stamp
+
+def _current_index():
+    """
+    (version dir, vectorstore, bm25, precomputed answers, their file stamp)
+    of the live index. Loads on first call;
+    afterwards, at most every INDEX_RELOAD_INTERVAL seconds, one caller checks
+    whether build_index.py published a newer version and swaps it in with a
+    single assignment. Other callers keep using the old one meanwhile, and a
+    version that fails to load is logged and skipped.
+    """
+    global _index, _index_checked
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                with timed("load_vectorstore"):
+                    _index = _load_index(current_index_dir(INDEX_DIR))
+                _index_checked = time.monotonic()
+    elif time.monotonic() - _index_checked >= INDEX_RELOAD_INTERVAL and _index_lock.acquire(blocking=False):
+        try:
+            _index_checked = time.monotonic()
+            path = current_index_dir(INDEX_DIR)
+            if path != _index[0]:
+                with timed("reload_index"):
+                    _index = _load_index(path)
+                logger.info(f"Switched to index {path}")
+            elif files_fingerprint([path / PRECOMPUTED_NAME]) != _index[4]:
+                _index = _index[:3] + _load_precomputed(path)
+                logger.info(f"Reloaded precomputed answers ({len(_index[3])})")
+        except Exception as e:
+            logger.error(f"Could not load index {path}, still serving {_index[0]}: {e}")
+        finally:
+            _index_lock.release()
+    return _index
+
+def get_index_version() -> Path:
+    """Get the version directory of the live index."""
+    return _current_index()[0]
+
 def get_vectorstore():
-    """Get cached FAISS vectorstore. Loads on first call."""
-    global _vectorstore
-    if _vectorstore is None:
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        _vectorstore = FAISS.load_local(str(INDEX_DIR), embeddings, allow_dangerous_deserialization=True)
-    return _vectorstore
+    """Get the FAISS vectorstore of the live index."""
+    return _current_index()[1]
+
+def get_precomputed() -> PrecomputedAnswers:
+    """Get the answers precomputed for the live index (FAQ and quick cards)."""
+    return _current_index()[3]
+
+def get_bm25():
+    """
+    Get (docstore ids, BM25Index) of the live index.
+    Returns None when the index was built without one.
+    """
+    return _current_index()[2]
+
+def load_reranker(backend: str = RERANKER_BACKEND) -> CrossEncoder:
+    """CrossEncoder on the given backend: "torch", "onnx" or "onnx-int8"."""
+    if backend == "torch":
+        return CrossEncoder(RERANKER_MODEL)
+    if backend == "onnx":
+        return CrossEncoder(RERANKER_MODEL, backend="onnx")
+    if backend == "onnx-int8":
+        return CrossEncoder(RERANKER_MODEL, backend="onnx", model_kwargs={"file_name": RERANKER_ONNX_INT8_FILE})
+    raise ValueError(f"Unknown reranker backend: {backend}")
 
 def get_reranker():
-    """Get cached CrossEncoder reranker. Loads on first call."""
+    """Get cached CrossEncoder reranker (RERANKER_BACKEND). Loads on first call."""
     global _reranker
     if _reranker is None:
-        _reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+        with _reranker_lock:
+            if _reranker is None:
+                with timed("load_reranker"):
+                    _reranker = load_reranker()
     return _reranker
 
-def get_llm():
-    """Get cached Ollama LLM. Loads on first call."""
+def get_llm() -> OllamaClient:
+    """
+    Get the shared Ollama client. Created on first call, which also starts
+    the keep-warm pings (OLLAMA_KEEP_WARM_INTERVAL).
+    """
     global _llm
     if _llm is None:
-        _llm = OllamaLLM(model=OLLAMA_MODEL, temperature=LLM_TEMPERATURE)
+        with _llm_lock:
+            if _llm is None:
+                _llm = OllamaClient(
+                    OLLAMA_BASE_URL, OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE,
+                    options={"temperature": LLM_TEMPERATURE, "num_ctx": OLLAMA_NUM_CTX,
+                             "num_predict": OLLAMA_NUM_PREDICT, "num_thread": OLLAMA_NUM_THREAD},
+                    timeout=LLM_REQUEST_TIMEOUT, connect_timeout=LLM_CONNECT_TIMEOUT,
+                    retries=LLM_RETRIES, backoff=LLM_RETRY_BACKOFF,
+                    # Every generation slot, plus the keep-warm ping
+                    pool_size=LLM_MAX_CONCURRENT + 1,
+                )
+                if OLLAMA_KEEP_WARM_INTERVAL:
+                    _llm.start_keep_warm(OLLAMA_KEEP_WARM_INTERVAL)
     return _llm
 
+def _warm_llm():
+    # Loads the model into Ollama's memory, so the first question does not wait for it
+    with timed("load_llm"):
+        get_llm().warm()
+
+# ---------------------------
+# Startup warmup + readiness
+# ---------------------------
+_status: Dict[str, str] = {}
+
+def _warm_retrieval():
+    # One dummy query through the embedder and FAISS warms both
+    get_vectorstore().similarity_search_with_score("DOST services", k=1)
+
+def _warm_reranker():
+    get_reranker().predict([("DOST services", "DOST Region II offers testing services.")])
+
+WARMUP_TASKS: Dict[str, Callable[[], None]] = {
+    "retrieval": _warm_retrieval,
+    "bm25": get_bm25,
+    "reranker": _warm_reranker,
+    "llm": _warm_llm,
+}
+
+def _warm_component(name: str, fn: Callable[[], None], retry: bool = False) -> bool:
+    try:
+        with timed(f"warmup_{name}"):
+            fn()
+        _status[name] = "ready"
+        return True
+    except Exception as e:
+        if retry:
+            logger.warning(f"Warmup of {name} still failing: {e}")
+        else:
+            logger.exception(f"Warmup of {name} failed")
+        _status[name] = f"error: {e}"
+        return False
+
+def _retry_failed(tasks: Dict[str, Callable[[], None]], interval: float) -> None:
+    # Runs until every component has loaded once
+    while tasks:
+        time.sleep(interval)
+        for name, fn in list(tasks.items()):
+            if _warm_component(name, fn, retry=True):
+                logger.info(f"Warmup of {name} succeeded on retry")
+                del tasks[name]
+
+def warm_up(extra: Optional[Dict[str, Callable[[], None]]] = None,
+            retry_interval: float = WARMUP_RETRY_INTERVAL) -> bool:
+    """
+    Load and warm every model in parallel (plus any extra name -> callable
+    tasks), recording per-component status for readiness(). Returns True
+    when everything succeeded; failed components are retried in a background
+    thread every retry_interval seconds (and still load lazily on first use).
+    """
+    tasks = dict(WARMUP_TASKS, **(extra or {}))
+    for name in tasks:
+        _status[name] = "loading"
+
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warmup") as pool:
+        results = dict(zip(tasks, pool.map(lambda item: _warm_component(*item), tasks.items())))
+
+    failed = {name: fn for name, fn in tasks.items() if not results[name]}
+    if failed and retry_interval:
+        threading.Thread(target=_retry_failed, args=(failed, retry_interval),
+                         name="warmup-retry", daemon=True).start()
+    return not failed
 
+def readiness() -> Dict[str, object]:
+    """{"ready": bool, "components": {name: status}} for the /readyz endpoint."""
+    components = dict(_status)
+    return {"ready": bool(components) and all(s == "ready" for s in components.values()),
+            "components": components}
@@ -1,38 +1,175 @@
 import json
+import logging
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from src.text_index import BM25Index, STOPWORDS, compile_keywords, compile_phrases, tokenize
+from src.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# (dataset, field searched, intent keywords), checked in this order
+DATASETS = [
+    ("contacts", "office", ["contact", "email", "phone", "hotline"]),
+    ("addresses", "office", ["address", "location", "where"]),
+    ("fees", "service", ["fee", "fees", "cost", "how much", "price", "charge", "rate"]),
+    ("requirements", "service", ["requirement", "requirements", "documents needed", "needed documents"]),
+    ("procedures", "service", ["procedure", "process", "steps", "how to apply", "apply"]),
+]
+
+INTENT_PATTERNS = {name: compile_keywords(keywords) for name, _, keywords in DATASETS}
+
+# Template values shipped in data/official. Items still holding any of these
+# are dropped at load time, so such queries fall back to RAG.
+PLACEHOLDER_INDICATORS = [
+    "REPLACE_ME",
+    "Step 1",
+    "Step 2",
+    "Step 3",
+    "Doc 1",
+    "Doc 2",
+    "YYYY-MM-DD",
+    "Procedure memo / document title",
+    "Requirements memo / document title",
+]
+PLACEHOLDER_PATTERN = compile_phrases(PLACEHOLDER_INDICATORS)
 
 def _load_json(path: Path) -> Dict[str, Any]:
     if not path.exists():
         return {"items": []}
     return json.loads(path.read_text(encoding="utf-8"))
 
+def _validate(data: Any, key: str) -> None:
+    """Raise ValueError unless data is {"items": [{key: ..., ...}, ...]}."""
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+        raise ValueError('expected an object with an "items" list')
+    for i, item in enumerate(data["items"]):
+        if not isinstance(item, dict):
+            raise ValueError(f"item {i} is not an object")
+        if not isinstance(item.get(key), str):
+            raise ValueError(f'item {i} has no "{key}" text')
+
+def is_placeholder_item(item: Dict[str, Any]) -> bool:
+    return bool(PLACEHOLDER_PATTERN.search(json.dumps(item, ensure_ascii=False)))
+
+def _index_dataset(data: Dict[str, Any], key: str) -> Dict[str, Any]:
+    # Placeholder items are filtered and the inverted index over the searched
+    # field is built once here, not per query
+    data["items"] = [it for it in data.get("items", []) if not is_placeholder_item(it)]
+    data["index"] = BM25Index([str(it.get(key, "")) for it in data["items"]])
+    return data
+
+def load_dataset(official_dir: Path, name: str, key: str) -> Dict[str, Any]:
+    """Parse, validate and index one dataset; raises ValueError if the file is bad."""
+    data = _load_json(official_dir / f"{name}.json")
+    _validate(data, key)
+    return _index_dataset(data, key)
+
 def load_official(official_dir: Path) -> Dict[str, Dict[str, Any]]:
-    return {
-        "contacts": _load_json(official_dir / "contacts.json"),
-        "addresses": _load_json(official_dir / "addresses.json"),
-        "fees": _load_json(official_dir / "fees.json"),
-        "requirements": _load_json(official_dir / "requirements.json"),
-        "procedures": _load_json(official_dir / "procedures.json"),
-    }
-
-def _search_items(items: List[Dict[str, Any]], query: str, key: str) -> List[Dict[str, Any]]:
-    q = query.lower()
-    scored = []
-    for it in items:
-        text = str(it.get(key, "")).lower()
-        if not text:
-            continue
-        if q in text or any(tok in text for tok in q.split()):
-            scored.append(it)
-    return scored[:5]
+    return {name: load_dataset(official_dir, name, key) for name, key, _ in DATASETS}
 
-def answer_official(official_db: Dict[str, Dict[str, Any]], query: str) -> Tuple[str, List[Dict[str, Any]]]:
-    q = query.lower()
+def _file_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+class OfficialStore:
+    """
+    The official DB with hot reload. A watcher thread checks the mtime of each
+    dataset's JSON file every interval seconds; a changed file is re-parsed
+    and re-indexed on its own and the DB dict is replaced in one assignment,
+    so lookups always see a complete version. A file that fails to parse or
+    validate is logged and the previous version stays live. Callbacks passed
+    to on_change run after each swap (e.g. to drop cached answers).
+    """
 
+    def __init__(self, official_dir: Path, interval: float):
+        self.official_dir = official_dir
+        self.interval = interval
+        self.version = 0
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stamps = {name: _file_stamp(official_dir / f"{name}.json") for name, _, _ in DATASETS}
+        # A bad file at startup is as fatal as before; only reloads are forgiving
+        self._db = load_official(official_dir)
+        self._thread = None
+
+    @property
+    def db(self) -> Dict[str, Dict[str, Any]]:
+        return self._db
+
+    def on_change(self, callback: Callable[[], None]) -> None:
+        self._listeners.append(callback)
+
+    def refresh(self) -> List[str]:
+        """Reload datasets whose files changed; returns the names swapped in."""
+        with self._lock:
+            db = dict(self._db)
+            changed = []
+            for name, key, _ in DATASETS:
+                path = self.official_dir / f"{name}.json"
+                stamp = _file_stamp(path)
+                if stamp == self._stamps[name]:
+                    continue
+                # Recorded even on failure, so a bad file is reported once, not every interval
+                self._stamps[name] = stamp
+                try:
+                    with timed("official_reload"):
+                        db[name] = load_dataset(self.official_dir, name, key)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Keeping previous {name} data, {path} is invalid: {e}")
+                    continue
+                changed.append(name)
+            if not changed:
+                return []
+            self._db = db
+            self.version += 1
+        logger.info(f"Reloaded official data: {', '.join(changed)}")
+        for callback in self._listeners:
+            callback()
+        return changed
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Official data reload failed: {e}")
+
+    def start_watcher(self) -> None:
+        if self._thread is None and self.interval:
+            self._thread = threading.Thread(target=self._watch, name="official-reload", daemon=True)
+            self._thread.start()
+
+def detect_intents(query: str) -> List[str]:
+    """Datasets whose intent keywords appear in query (whole words only)."""
+    return [name for name, _, _ in DATASETS if INTENT_PATTERNS[name].search(query)]
+
+def _search_items(data: Dict[str, Any], query: str, intent: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Rank items of one dataset against query with BM25. Intent keywords and
+    stopwords are ignored; a query made only of those ("what is your phone?")
+    returns the first items, since the intent already picked the dataset.
+    """
+    items = data.get("items", [])
+    query = INTENT_PATTERNS[intent].sub(" ", query)
+    tokens = [t for t in tokenize(query) if t not in STOPWORDS]
+    if not tokens:
+        return items[:limit]
+    return [items[i] for i, _ in data["index"].search(tokens, limit)]
+
+@timed("official_lookup")
+def answer_official(official_db: Dict[str, Dict[str, Any]], query: str) -> Tuple[str, List[Dict[str, Any]]]:
     # Decide which dataset to use based on keywords
-    if any(k in q for k in ["contact", "email", "phone", "hotline"]):
-        matches = _search_items(official_db["contacts"]["items"], query, "office")
+    intents = detect_intents(query)
+
+    if "contacts" in intents:
+        matches = _search_items(official_db["contacts"], query, "contacts")
         if matches:
             lines = ["**Official Contacts:**"]
             sources = []
@@ -42,8 +179,8 @@ def answer_official(official_db: Dict[str, Dict[str, Any]], query: str) -> Tuple
                     sources.append({"source": m["source"]})
             return "\n".join(lines), sources
 
-    if any(k in q for k in ["address", "location", "where"]):
-        matches = _search_items(official_db["addresses"]["items"], query, "office")
+    if "addresses" in intents:
+        matches = _search_items(official_db["addresses"], query, "addresses")
         if matches:
             lines = ["**Official Office Address:**"]
             sources = []
@@ -53,8 +190,8 @@ def answer_official(official_db: Dict[str, Dict[str, Any]], query: str) -> Tuple
                     sources.append({"source": m["source"]})
             return "\n".join(lines), sources
 
-    if any(k in q for k in ["fee", "fees", "cost", "how much", "price", "charge", "rate"]):
-        matches = _search_items(official_db["fees"]["items"], query, "service")
+    if "fees" in intents:
+        matches = _search_items(official_db["fees"], query, "fees")
         if matches:
             lines = ["**Official Fees:**"]
             sources = []
@@ -66,8 +203,8 @@ def answer_official(official_db: Dict[str, Dict[str, Any]], query: str) -> Tuple
                     sources.append({"source": m["source"]})
             return "\n".join(lines), sources
 
-    if any(k in q for k in ["requirement", "requirements", "documents needed", "needed documents"]):
-        matches = _search_items(official_db["requirements"]["items"], query, "service")
+    if "requirements" in intents:
+        matches = _search_items(official_db["requirements"], query, "requirements")
         if matches:
             lines = ["**Official Requirements:**"]
             sources = []
@@ -79,8 +216,8 @@ def answer_official(official_db: Dict[str, Dict[str, Any]], query: str) -> Tuple
                     sources.append({"source": m["source"]})
             return "\n".join(lines), sources
 
-    if any(k in q for k in ["procedure", "process", "steps", "how to apply", "apply"]):
-        matches = _search_items(official_db["procedures"]["items"], query, "service")
+    if "procedures" in intents:
+        matches = _search_items(official_db["procedures"], query, "procedures")
         if matches:
             lines = ["**Official Procedure:**"]
             sources = []
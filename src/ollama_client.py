@@ -0,0 +1,218 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class OllamaError(Exception):
+    """Raised when Ollama returns an error, or keeps failing after all retries."""
+
+class _Retryable(Exception):
+    # 5xx from Ollama (model still loading, runner crashed): worth another try
+    pass
+
+# Failures where Ollama never started generating: a refused or timed-out
+# connect, a pooled keep-alive connection the server had already closed, or a
+# 5xx. A read timeout is not retried: Ollama may still be generating, and a
+# retry would queue the same work again behind it.
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, _Retryable)
+
+REGISTRY.help["dost_llm_retries_total"] = "Ollama requests retried, by cause"
+
+class OllamaClient:
+    """
+    Client for Ollama's /api/generate with the OllamaLLM surface used by
+    rag_engine: invoke, stream, ainvoke and astream.
+
+    Requests go over one pooled keep-alive HTTP session per side (sync and
+    async), so a generation does not pay for a new TCP connection. Each
+    request asks Ollama to keep the model loaded for keep_alive and carries
+    the generation options (num_ctx, num_predict, ...). Connection failures
+    and 5xx responses (_RETRY_ERRORS) are retried up to `retries` times with
+    exponential backoff; a stream is only retried before its first token,
+    since the caller may already have shown the text. Read timeouts and
+    other transport errors raise OllamaError at once.
+    """
+
+    def __init__(self, base_url: str, model: str, keep_alive: Any = "30m",
+                 options: Optional[Dict[str, Any]] = None, timeout: float = 120.0,
+                 connect_timeout: float = 3.0, retries: int = 2, backoff: float = 0.5,
+                 pool_size: int = 4):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        # None means "Ollama's default" and is not sent
+        self.options = {k: v for k, v in (options or {}).items() if v is not None}
+        self.retries = retries
+        self.backoff = backoff
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._client = httpx.Client(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+        self._aclient = None  # bound to the running event loop, created on first use
+        self.last_used = time.monotonic()
+        self._keep_warm = None
+
+    def _payload(self, prompt: Optional[str], stream: bool) -> Dict[str, Any]:
+        # Options go on warm pings too: Ollama reloads the runner when num_ctx
+        # or num_thread differ from the ones the model was loaded with
+        payload = {"model": self.model, "stream": stream, "keep_alive": self.keep_alive,
+                   "options": self.options}
+        if prompt is not None:
+            payload["prompt"] = prompt
+        return payload
+
+    @staticmethod
+    def _check(resp: httpx.Response) -> None:
+        # Call after the body was read
+        if resp.status_code < 400:
+            return
+        try:
+            message = resp.json().get("error", resp.text)
+        except ValueError:
+            message = resp.text
+        message = f"Ollama returned {resp.status_code}: {message}"
+        if resp.status_code >= 500:
+            raise _Retryable(message)
+        raise OllamaError(message)
+
+    @staticmethod
+    def _parse(line: str) -> Dict[str, Any]:
+        data = json.loads(line)
+        if data.get("error"):
+            raise OllamaError(f"Ollama error: {data['error']}")
+        return data
+
+    @staticmethod
+    def _failed(error: httpx.TransportError) -> OllamaError:
+        return OllamaError(f"Ollama request failed: {type(error).__name__}: {error}")
+
+    def _give_up_or_wait(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before the next attempt; raises OllamaError after the last one."""
+        if attempt >= self.retries:
+            raise OllamaError(f"Ollama request failed after {attempt + 1} attempt(s): {error}") from error
+        cause = "server_error" if isinstance(error, _Retryable) else type(error).__name__
+        REGISTRY.inc("dost_llm_retries_total", "cause", cause)
+        delay = self.backoff * 2 ** attempt
+        logger.warning(f"Ollama request failed ({error}), retrying in {delay:.1f}s")
+        return delay
+
+    # ---------------------------
+    # Sync
+    # ---------------------------
+    def invoke(self, prompt: str) -> str:
+        return self._generate(self._payload(prompt, stream=False)).get("response", "")
+
+    def warm(self) -> None:
+        """Load the model (a request without a prompt) and restart its keep_alive timer."""
+        self._generate(self._payload(None, stream=False))
+
+    def _generate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self._client.post("/api/generate", json=payload)
+                self._check(resp)
+                self.last_used = time.monotonic()
+                return self._parse(resp.text)
+            except _RETRY_ERRORS as e:
+                time.sleep(self._give_up_or_wait(attempt, e))
+            except httpx.TransportError as e:
+                raise self._failed(e) from e
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        payload = self._payload(prompt, stream=True)
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                with self._client.stream("POST", "/api/generate", json=payload) as resp:
+                    if resp.status_code >= 400:
+                        resp.read()
+                    self._check(resp)
+                    for line in resp.iter_lines():
+                        if not line:
+                            continue
+                        data = self._parse(line)
+                        if data.get("response"):
+                            started = True
+                            yield data["response"]
+                self.last_used = time.monotonic()
+                return
+            except _RETRY_ERRORS as e:
+                if started:
+                    raise OllamaError(f"Ollama stream broke off: {e}") from e
+                time.sleep(self._give_up_or_wait(attempt, e))
+            except httpx.TransportError as e:
+                raise self._failed(e) from e
+
+    # ---------------------------
+    # Async
+    # ---------------------------
+    def _async_client(self) -> httpx.AsyncClient:
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+        return self._aclient
+
+    async def ainvoke(self, prompt: str) -> str:
+        payload = self._payload(prompt, stream=False)
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await self._async_client().post("/api/generate", json=payload)
+                self._check(resp)
+                self.last_used = time.monotonic()
+                return self._parse(resp.text).get("response", "")
+            except _RETRY_ERRORS as e:
+                await asyncio.sleep(self._give_up_or_wait(attempt, e))
+            except httpx.TransportError as e:
+                raise self._failed(e) from e
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        payload = self._payload(prompt, stream=True)
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                async with self._async_client().stream("POST", "/api/generate", json=payload) as resp:
+                    if resp.status_code >= 400:
+                        await resp.aread()
+                    self._check(resp)
+                    async for line in resp.aiter_lines():
+                        if not line:
+                            continue
+                        data = self._parse(line)
+                        if data.get("response"):
+                            started = True
+                            yield data["response"]
+                self.last_used = time.monotonic()
+                return
+            except _RETRY_ERRORS as e:
+                if started:
+                    raise OllamaError(f"Ollama stream broke off: {e}") from e
+                await asyncio.sleep(self._give_up_or_wait(attempt, e))
+            except httpx.TransportError as e:
+                raise self._failed(e) from e
+
+    # ---------------------------
+    # Keep-warm
+    # ---------------------------
+    def _keep_warm_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(max(1.0, interval - (time.monotonic() - self.last_used)))
+            if time.monotonic() - self.last_used < interval:
+                continue  # real traffic kept the model loaded
+            try:
+                self.warm()
+            except Exception as e:
+                logger.warning(f"Keep-warm ping to Ollama failed: {e}")
+                self.last_used = time.monotonic()  # try again one interval later
+
+    def start_keep_warm(self, interval: float) -> None:
+        """Ping Ollama whenever no request was made for interval seconds (daemon thread)."""
+        if self._keep_warm is None:
+            self._keep_warm = threading.Thread(target=self._keep_warm_loop, args=(interval,),
+                                               name="ollama-keep-warm", daemon=True)
+            self._keep_warm.start()
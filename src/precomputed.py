@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import PRECOMPUTED_MIN_OVERLAP
+from src.answer_cache import normalize_query
+from src.formatters import format_money_and_units, format_sources
+from src.text_index import STOPWORDS, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Stored in each index version next to index.faiss, so a rebuild always
+# comes with answers computed from the same documents.
+PRECOMPUTED_NAME = "precomputed.json"
+
+# Fixed questions sent by the quick cards in app.py
+CARD_QUESTIONS = {
+    "tech-card": "Tell me about DOST's latest technologies and innovations.",
+    "programs-card": "What are the current DOST programs and projects?",
+    "services-card": "What services does DOST Region II offer?",
+}
+
+# FAQ layout used in data/public_docs/FAQ.txt:
+#   **❓ Question?**
+#   → answer line
+#   → answer line
+_FAQ_QUESTION = re.compile(r"^\s*\*\*\s*❓\s*(.+?)\s*\*\*\s*$")
+_FAQ_ANSWER = re.compile(r"^\s*→\s*(.+?)\s*$")
+
+def _faq_answer(lines: List[str]) -> str:
+    body = lines[0] if len(lines) == 1 else "\n".join(f"- {line}" for line in lines)
+    return format_money_and_units(body)
+
+def parse_faq(text: str) -> List[Tuple[str, str]]:
+    """(question, answer) pairs from curated FAQ text; answers are rendered as markdown."""
+    pairs = []
+    question, lines = None, []
+    for line in text.splitlines():
+        q = _FAQ_QUESTION.match(line)
+        a = _FAQ_ANSWER.match(line)
+        if q or (lines and not a and line.strip()):
+            # A new question, or other text after the answer, ends the entry
+            if question and lines:
+                pairs.append((question, _faq_answer(lines)))
+            question, lines = (q.group(1) if q else None), []
+        elif question and a:
+            lines.append(a.group(1))
+    if question and lines:
+        pairs.append((question, _faq_answer(lines)))
+    return pairs
+
+def faq_entries(docs_dir: Path) -> List[Dict[str, Any]]:
+    """Precomputed entries for every FAQ question found in the .txt documents."""
+    entries = []
+    for path in sorted(docs_dir.glob("*.txt")):
+        for question, answer in parse_faq(path.read_text(encoding="utf-8", errors="ignore")):
+            entries.append({"kind": "faq", "question": question,
+                            "answer": answer + "\n" + format_sources([{"source": path.name}])})
+    return entries
+
+def save_precomputed(index_dir: Path, entries: List[Dict[str, Any]]) -> None:
+    tmp = index_dir / (PRECOMPUTED_NAME + ".tmp")
+    tmp.write_text(json.dumps({"entries": entries}, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, index_dir / PRECOMPUTED_NAME)
+
+def load_entries(index_dir: Path) -> List[Dict[str, Any]]:
+    path = index_dir / PRECOMPUTED_NAME
+    if not path.exists():
+        return []
+    return json.loads(path.read_text(encoding="utf-8"))["entries"]
+
+def _terms(text: str) -> frozenset:
+    return frozenset(t for t in tokenize(text) if t not in STOPWORDS)
+
+class PrecomputedAnswers:
+    """
+    Answers prepared at index build time. A query matches an entry when its
+    normalized text is identical, or when it contains every content word of
+    the question and their overlap (Jaccard) is at least min_overlap. A query
+    that drops a qualifier ("tests" for "microbiological tests") asks
+    something broader and is left to retrieval.
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]], min_overlap: float = PRECOMPUTED_MIN_OVERLAP):
+        self.min_overlap = min_overlap
+        self._exact = {normalize_query(e["question"]): e["answer"] for e in entries}
+        self._terms = [(_terms(e["question"]), e["answer"]) for e in entries]
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def match(self, query: str) -> Optional[str]:
+        answer = self._exact.get(normalize_query(query))
+        if answer is not None:
+            return answer
+        terms = _terms(query)
+        if not terms:
+            return None
+        best, best_score = None, self.min_overlap
+        for question_terms, candidate in self._terms:
+            if not question_terms <= terms:
+                continue
+            score = len(terms & question_terms) / len(terms | question_terms)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
@@ -1,15 +1,31 @@
+import re
+import asyncio
 import logging
-from typing import List, Tuple, Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, Iterator, AsyncIterator, Callable, Optional
 
 from sentence_transformers import CrossEncoder
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaLLM
 from langchain_core.prompts import PromptTemplate
 
-from config import INDEX_DIR, OLLAMA_MODEL, LLM_TEMPERATURE, MAX_FAISS_DIST, RERANK_TOP_K, ENABLE_VERIFY
+from config import (
+    INDEX_DIR, OLLAMA_MODEL, LLM_TEMPERATURE, MAX_FAISS_DIST, RERANK_TOP_K, ENABLE_VERIFY,
+    RETRIEVE_K, RERANK_SKIP_MARGIN,
+    RERANK_BATCHING, RERANK_MAX_WAIT_MS, RERANK_MAX_BATCH, RERANK_CACHE_SIZE, RERANK_DEDUP_MIN_OVERLAP,
+    HYBRID_RETRIEVAL, BM25_K, RRF_K, RERANK_CANDIDATES,
+    ASYNC_EXECUTOR_WORKERS, CONTEXT_TOKEN_BUDGET,
+)
 from src.formatters import format_money_and_units
-from src.model_cache import get_vectorstore, get_reranker, get_llm
+from src.model_cache import get_vectorstore, get_bm25, get_reranker, get_llm, get_index_version, llm_gate
+from src.answer_cache import normalize_query
+from src.embedding_cache import chunk_hash
+from src.rerank_scheduler import RerankScheduler
+from src.metrics import REGISTRY, timed, register_gauge
+from src.context_builder import estimate_tokens, pack_context
+from src.text_index import STOPWORDS, compile_phrases, tokenize
 
 logger = logging.getLogger(__name__)
 
@@ -46,153 +62,591 @@ ANSWER:
 {answer}
 """
 
+GENERAL_PROMPT_TEXT = """You are DOST Region II's helpful AI assistant.
+Respond conversationally and briefly to the user message below.
+- If it is a greeting (like "hi", "hello", or "how are you"), greet the user back naturally without mentioning Evidence or Sources.
+- If it asks generally about DOST Region II services or programs,
+  describe the types of support DOST offices typically provide in
+  the Philippines (e.g., science and technology programs, testing
+  and calibration services, scholarships, etc.) and suggest that
+  the user contact DOST Region II directly for specific, updated details.
+
+Respond naturally and conversationally. Do NOT include "Answer:", "Evidence:", or "Sources:" sections.
+
+User message: {query}
+Assistant:"""
+
+UNSUPPORTED_ANSWER = "I don't have enough information to answer that."
+
+# Greetings / thanks / small talk: answered with the general prompt without
+# touching FAISS, the reranker or a long context.
+SMALL_TALK_PATTERN = re.compile(
+    r"^\s*(?:(?:hi|hello|hey|yo|good\s+(?:morning|afternoon|evening|day)|greetings)(?:\s+(?:there|po|dost))?"
+    r"|thanks?(?:\s+you)?(?:\s+(?:so\s+much|po))?|thank\s+you(?:\s+(?:so\s+much|po))?|ty|salamat(?:\s+po)?"
+    r"|how\s+are\s+you(?:\s+doing)?(?:\s+today)?|who\s+are\s+you|bye|goodbye|ok(?:ay)?|cool|nice)"
+    r"[\s!.?,]*$",
+    re.IGNORECASE,
+)
+
+def is_small_talk(query: str) -> bool:
+    return bool(SMALL_TALK_PATTERN.match(query))
+
 # load_vectorstore() is now replaced by get_vectorstore() from model_cache
 # Keeping this for backwards compatibility if needed, but using cached version is preferred
 def load_vectorstore():
     return get_vectorstore()
 
+# Bounded pool for blocking model calls made from the async path
+_executor = ThreadPoolExecutor(max_workers=ASYNC_EXECUTOR_WORKERS, thread_name_prefix="rag")
+
+async def run_blocking(fn: Callable, *args):
+    """Run a blocking call (FAISS, embeddings, CrossEncoder) in the bounded pool."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+# One scheduler per reranker instance, created on first use
+_rerank_scheduler = None
+_rerank_scheduler_lock = threading.Lock()
+
+def get_rerank_scheduler(reranker: CrossEncoder) -> RerankScheduler:
+    global _rerank_scheduler
+    with _rerank_scheduler_lock:
+        if _rerank_scheduler is None:
+            _rerank_scheduler = RerankScheduler(
+                lambda pairs: reranker.predict(pairs, batch_size=RERANK_MAX_BATCH),
+                max_batch=RERANK_MAX_BATCH,
+                max_wait=RERANK_MAX_WAIT_MS / 1000,
+            )
+    return _rerank_scheduler
+
+register_gauge("dost_rerank_queue_depth", "Rerank requests waiting for the next batch",
+               lambda: _rerank_scheduler.queue_depth if _rerank_scheduler else 0)
+
+class RerankScoreCache:
+    """
+    Bounded LRU of CrossEncoder scores keyed on (normalized query, chunk id).
+    Chunk ids are only unique within one index version, so the cache empties
+    whenever a new version goes live.
+    """
+
+    def __init__(self, size: int = RERANK_CACHE_SIZE):
+        self.size = size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @staticmethod
+    def _key(query: str, doc) -> Tuple[str, str]:
+        # Pickled legacy indexes have no chunk ids: fall back to the text hash
+        return normalize_query(query), getattr(doc, "id", None) or chunk_hash(doc.page_content)
+
+    def lookup(self, query: str, docs: List, version: Any = None) -> List[Optional[float]]:
+        """Cached score per doc, None where it still has to be scored."""
+        with self._lock:
+            if version != self._version:
+                self._scores.clear()
+                self._version = version
+            out = []
+            for d in docs:
+                key = self._key(query, d)
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                out.append(score)
+            hits = sum(s is not None for s in out)
+            self.hits += hits
+            self.misses += len(out) - hits
+        REGISTRY.inc("dost_rerank_cache_lookups_total", "result", "hit", hits)
+        REGISTRY.inc("dost_rerank_cache_lookups_total", "result", "miss", len(out) - hits)
+        return out
+
+    def store(self, query: str, docs: List, scores: List[float]) -> None:
+        with self._lock:
+            for d, score in zip(docs, scores):
+                self._scores[self._key(query, d)] = float(score)
+            while len(self._scores) > self.size:
+                self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+rerank_cache = RerankScoreCache()
+
+REGISTRY.help["dost_rerank_cache_lookups_total"] = "Rerank (query, chunk) pairs by result: cached score or scored"
+register_gauge("dost_rerank_cache_hit_ratio", "Share of rerank pairs served from the score cache",
+               lambda: rerank_cache.hits / max(1, rerank_cache.hits + rerank_cache.misses))
+
+def _cached_scores(query: str, docs: List) -> Tuple[List[Optional[float]], List]:
+    # (score or None per doc, docs that still need the CrossEncoder)
+    scores = rerank_cache.lookup(query, docs, get_index_version())
+    return scores, [d for d, s in zip(docs, scores) if s is None]
+
+def _ranked(query: str, docs: List, cached: List[Optional[float]], missing: List,
+            new_scores) -> List[Tuple[Any, float]]:
+    rerank_cache.store(query, missing, new_scores)
+    fresh = iter(new_scores)
+    scores = [s if s is not None else float(next(fresh)) for s in cached]
+    return sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
+
+@timed("rerank")
+def rerank_with_scores(query: str, docs: List, reranker: CrossEncoder) -> List[Tuple[Any, float]]:
+    """(doc, CrossEncoder score) pairs, best first. Cached scores are reused."""
+    cached, missing = _cached_scores(query, docs)
+    pairs = [(query, d.page_content) for d in missing]
+    if not pairs:
+        scores = []
+    elif RERANK_BATCHING:
+        # Scored together with pairs from other in-flight requests
+        scores = get_rerank_scheduler(reranker).score(pairs)
+    else:
+        scores = reranker.predict(pairs)
+    return _ranked(query, docs, cached, missing, scores)
+
 def rerank(query: str, docs: List, reranker: CrossEncoder) -> List:
-    pairs = [(query, d.page_content) for d in docs]
-    scores = reranker.predict(pairs)
-    ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-    return [d for d, _ in ranked]
-
-def build_context(docs: List) -> Tuple[str, List[Dict[str, Any]]]:
-    sources = []
-    blocks = []
+    return [d for d, _ in rerank_with_scores(query, docs, reranker)]
+
+async def rerank_with_scores_async(query: str, docs: List, reranker: CrossEncoder) -> List[Tuple[Any, float]]:
+    with timed("rerank"):
+        # Off the event loop: checking the index version may load a new one
+        cached, missing = await run_blocking(_cached_scores, query, docs)
+        pairs = [(query, d.page_content) for d in missing]
+        if not pairs:
+            scores = []
+        elif RERANK_BATCHING:
+            # Awaits the batch without holding an executor thread; shielded so
+            # a cancelled chat turn does not cancel the scheduler's future
+            scores = await asyncio.shield(asyncio.wrap_future(get_rerank_scheduler(reranker).submit(pairs)))
+        else:
+            scores = await run_blocking(reranker.predict, pairs)
+    return _ranked(query, docs, cached, missing, scores)
+
+def lexical_search(query: str, vectorstore, k: int = BM25_K) -> List:
+    """BM25 search over the chunks in vectorstore; [] if no BM25 index was built."""
+    bm25 = get_bm25()
+    if bm25 is None:
+        return []
+    ids, index = bm25
+    tokens = [t for t in tokenize(query) if t not in STOPWORDS]
+    docs = []
+    with timed("bm25_search"):
+        hits = index.search(tokens, k)
+    for pos, _ in hits:
+        doc = vectorstore.docstore.search(ids[pos])
+        # The docstore returns an error string for unknown ids (stale BM25 file)
+        if not isinstance(doc, str):
+            docs.append(doc)
+    return docs
+
+def fuse_rankings(rankings: List[List], k: int = RRF_K) -> List:
+    """Reciprocal rank fusion: score(d) = sum over rankings of 1 / (k + rank)."""
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, d in enumerate(ranking, start=1):
+            key = (d.metadata.get("source"), d.page_content)
+            docs.setdefault(key, d)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+REGISTRY.help["dost_rerank_duplicates_total"] = "Near-duplicate candidates dropped before reranking"
+
+def collapse_duplicates(docs: List, min_overlap: float = RERANK_DEDUP_MIN_OVERLAP) -> List:
+    """
+    Drop docs whose content terms are at least min_overlap contained in a
+    doc ranked before them (the same passage extracted from the PDF and the
+    TXT of a brochure, overlapping chunks), keeping the better-ranked copy.
+    """
+    kept, kept_terms = [], []
     for d in docs:
-        src = d.metadata.get("source", "unknown")
-        sources.append({"source": src})
-        blocks.append(f"[Source: {src}]\n{d.page_content}")
-    return "\n\n".join(blocks), sources
+        terms = {t for t in tokenize(d.page_content) if t not in STOPWORDS}
+        if terms and any(len(terms & t) >= min_overlap * len(terms) for t in kept_terms):
+            continue
+        kept.append(d)
+        kept_terms.append(terms)
+    if len(kept) < len(docs):
+        REGISTRY.inc("dost_rerank_duplicates_total", amount=len(docs) - len(kept))
+    return kept
+
+def build_context(docs: List, query: str = "", scores: Optional[List[float]] = None,
+                  budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, List[Dict[str, Any]]]:
+    """Token-budgeted context from ranked docs (see context_builder.pack_context)."""
+    return pack_context(query, docs, scores, budget)
+
+# Phrases that point at our internal sources; scrubbed from answers with one
+# precompiled pattern (longest match wins: "the faqs" over "the faq").
+DOC_REFERENCE_PHRASES = [
+    "according to the faqs",
+    "according to the faq",
+    "according to the context",
+    "according to the documents",
+    "according to the provided context",
+    "based on the faqs",
+    "based on the faq",
+    "based on the context",
+    "based on the documents",
+    "from the faqs",
+    "from the faq",
+    "from the context",
+    "from the documents",
+    "as mentioned in the faqs",
+    "as mentioned in the context",
+    "as stated in the faqs",
+    "as stated in the context",
+]
+DOC_REFERENCE_PATTERN = compile_phrases(DOC_REFERENCE_PHRASES)
+_SPACES = re.compile(r"[ \t]+")
+_DOUBLE_COMMA = re.compile(r"\s*,\s*,")
+_DOUBLE_PERIOD = re.compile(r"\s*\.\s*\.")
+# Where the answer ends; the fallback path cuts the raw text at the first one
+SECTION_ENDS = ("evidence:", "sources:", "source:")
+_SECTION_MARKER = re.compile("Evidence:|Sources:|Source:")
+# While streaming, an unfinished line is shown without a trailing half of any
+# of these (lowercase): it would flash and then be scrubbed or cut off
+_HOLD_BACK = DOC_REFERENCE_PHRASES + ["not applicable", "answer:"] + list(SECTION_ENDS)
+_HOLD_PREFIXES = frozenset(p[:i] for p in _HOLD_BACK for i in range(1, len(p)))
+_HOLD_MAX = max(map(len, _HOLD_BACK))
+
+def _hold_back(line: str) -> str:
+    lower = line.lower()
+    for i in range(max(0, len(line) - _HOLD_MAX), len(line)):
+        if lower[i:] in _HOLD_PREFIXES:
+            return line[:i]
+    return line
+
+def _scrub(line: str) -> str:
+    line, n = DOC_REFERENCE_PATTERN.subn("", line)
+    if not n:
+        return line
+    line = _SPACES.sub(" ", line)
+    line = _DOUBLE_COMMA.sub(",", line)
+    line = _DOUBLE_PERIOD.sub(".", line)
+    return line.strip()
+
+class AnswerCleaner:
+    """
+    Incremental clean_answer + format_money_and_units for streamed output.
+    feed() takes the next chunk and returns the cleaned answer so far. Each
+    completed line is cleaned once and kept, so only the unfinished last line
+    is redone per chunk instead of the whole response. That line is shown
+    without a trailing partial "according to the ...", "Not applicable" or
+    section marker, so such text never flashes before it is removed.
+
+    structured=False (general prompt, no Answer:/Evidence: layout) only
+    applies the unit formatting.
+    """
+
+    def __init__(self, structured: bool = True):
+        self.structured = structured
+        self._chunks: List[str] = []
+        self._tail = ""         # unfinished last line
+        self._done = []         # cleaned, completed lines
+        self._in_answer = False
+        self._stopped = False   # reached Evidence:/Sources:
+        self._seen_text = False  # a non-blank line has completed
+        # Fallback for a response without an "Answer:" line, built alongside
+        self._fb_done = []      # cleaned, completed lines before the first section marker
+        self._fb_stopped = False
+
+    def _step(self, line: str, in_answer: bool) -> Tuple[bool, bool, Optional[str]]:
+        # -> (in_answer, stop, output line or None)
+        lower = line.strip().lower()
+        if lower.startswith("answer:"):
+            rest = line.split(":", 1)[1].strip()
+            return True, False, (format_money_and_units(_scrub(rest)) if rest else None)
+        if in_answer and lower.startswith(SECTION_ENDS):
+            return in_answer, True, None
+        if "not applicable" in lower or not in_answer:
+            return in_answer, False, None
+        return in_answer, False, format_money_and_units(_scrub(line))
+
+    @staticmethod
+    def _fallback_step(line: str) -> Tuple[bool, str]:
+        # -> (stop, output line): the line cut at a section marker, "Answer:" dropped
+        match = _SECTION_MARKER.search(line)
+        if match:
+            line = line[:match.start()]
+        return match is not None, format_money_and_units(_scrub(line.replace("Answer:", "")))
+
+    def feed(self, chunk: str, partial: bool = True) -> str:
+        """Add chunk; partial=False marks the end of the response."""
+        self._chunks.append(chunk)
+        *complete, self._tail = (self._tail + chunk).split("\n")
+        for line in complete:
+            self._seen_text = self._seen_text or bool(line.strip())
+            if not self.structured:
+                self._done.append(format_money_and_units(line))
+            elif not self._stopped:
+                self._in_answer, self._stopped, out = self._step(line, self._in_answer)
+                if out is not None:
+                    self._done.append(out)
+            if self.structured and not self._fb_stopped:
+                self._fb_stopped, out = self._fallback_step(line)
+                self._fb_done.append(out)
+
+        if not self.structured:
+            return "\n".join(self._done + [format_money_and_units(self._tail)])
+
+        if partial and not self._seen_text:
+            # Nothing shown until we know whether it starts with "Answer:",
+            # so the marker never flashes in the chat
+            head = self._tail.lstrip().lower()
+            if len(head) < len("answer:") and "answer:".startswith(head):
+                return ""
+
+        lines = self._done
+        if not self._stopped and self._tail:
+            tail = self._tail.strip().lower()
+            # Likewise hold back a half-written "Evidence:"/"Sources:"
+            if not (partial and self._in_answer and any(m.startswith(tail) for m in SECTION_ENDS)):
+                _, _, out = self._step(_hold_back(self._tail) if partial else self._tail, self._in_answer)
+                if out is not None:
+                    lines = lines + [out]
+        result = "\n".join(lines).strip()
+        if result:
+            return result
 
-def clean_answer(text: str) -> str:
+        # No Answer: section: drop Evidence/Sources sections from the raw text
+        lines = self._fb_done
+        if not self._fb_stopped and self._tail:
+            tail = _hold_back(self._tail) if partial else self._tail
+            lines = lines + [self._fallback_step(tail)[1]]
+        result = "\n".join(lines).strip()
+        if partial:
+            return result
+        return result if result else format_money_and_units("".join(self._chunks))
+
+def clean_answer(text: str, partial: bool = False) -> str:
     """
     Clean up LLM response by:
     - Extracting just the Answer: section
     - Removing Evidence: and Sources: sections (we add sources separately)
     - Removing "Not applicable" sections
     - Removing phrases that reference internal documents (e.g., "according to the FAQs")
+    - Emphasizing units (format_money_and_units)
+
+    With partial=True the text is an unfinished streamed response: nothing is
+    shown until we know whether it starts with "Answer:", so the marker never
+    flashes in the chat. Streaming callers should keep one AnswerCleaner
+    instead of calling this on the growing text.
+    """
+    return AnswerCleaner().feed(text, partial=partial)
+
+def _candidates(query: str) -> Tuple[List, bool]:
+    """
+    First-stage retrieval: FAISS top RETRIEVE_K within MAX_FAISS_DIST, fused
+    with BM25 when HYBRID_RETRIEVAL and at least one FAISS hit passed the
+    distance gate. Returns (docs, dominant); dominant means
+    the best FAISS hit clearly wins, so it is placed first and reranking
+    can be skipped.
     """
-    lines = text.split("\n")
-    cleaned = []
-    in_answer = False
-    skip_until_empty = False
-    
-    for line in lines:
-        line_lower = line.strip().lower()
-        
-        # Start capturing at "Answer:"
-        if line_lower.startswith("answer:"):
-            in_answer = True
-            # Take the rest of the line after "Answer:"
-            answer_part = line.split(":", 1)[1].strip()
-            if answer_part:
-                cleaned.append(answer_part)
-            continue
-        
-        # Stop at Evidence: or Sources: sections
-        if in_answer and (line_lower.startswith("evidence:") or 
-                         line_lower.startswith("sources:") or
-                         line_lower.startswith("source:")):
-            break
-        
-        # Skip "Not applicable" lines
-        if "not applicable" in line_lower:
-            continue
-        
-        # Add lines that are part of the answer
-        if in_answer:
-            cleaned.append(line)
-    
-    result = "\n".join(cleaned).strip()
-    # If cleaning removed everything, return original (fallback)
-    if not result:
-        # Fallback: just remove Evidence/Sources sections more simply
-        result = text
-        for marker in ["Evidence:", "Sources:", "Source:"]:
-            if marker in result:
-                result = result.split(marker)[0].strip()
-        result = result.replace("Answer:", "").strip()
-    
-    # Remove phrases that reference internal documents (post-processing)
-    phrases_to_remove = [
-        "according to the faqs",
-        "according to the faq",
-        "according to the context",
-        "according to the documents",
-        "according to the provided context",
-        "based on the faqs",
-        "based on the faq",
-        "based on the context",
-        "based on the documents",
-        "from the faqs",
-        "from the faq",
-        "from the context",
-        "from the documents",
-        "as mentioned in the faqs",
-        "as mentioned in the context",
-        "as stated in the faqs",
-        "as stated in the context",
-    ]
-    
-    result_lower = result.lower()
-    for phrase in phrases_to_remove:
-        if phrase in result_lower:
-            # Remove the phrase and clean up surrounding punctuation
-            import re
-            pattern = re.compile(re.escape(phrase), re.IGNORECASE)
-            result = pattern.sub("", result)
-            # Clean up extra spaces and punctuation
-            result = re.sub(r'\s+', ' ', result)
-            result = re.sub(r'\s*,\s*,', ',', result)  # Remove double commas
-            result = re.sub(r'\s*\.\s*\.', '.', result)  # Remove double periods
-            result = result.strip()
-    
-    return result if result else text
-
-def rag_answer(query: str) -> Tuple[str, List[Dict[str, Any]]]:
     # Use cached models instead of loading each time (much faster!)
     vectorstore = get_vectorstore()
-    reranker_model = get_reranker()
-    llm = get_llm()
 
     # Confidence gate using similarity_search_with_score
-    docs_scores = vectorstore.similarity_search_with_score(query, k=8)
-    if not docs_scores:
+    with timed("faiss_search"):
+        docs_scores = vectorstore.similarity_search_with_score(query, k=RETRIEVE_K)
+    docs_scores = [(d, dist) for d, dist in docs_scores if dist <= MAX_FAISS_DIST]
+    dominant = (
+        len(docs_scores) == 1
+        or (len(docs_scores) > 1 and docs_scores[1][1] - docs_scores[0][1] >= RERANK_SKIP_MARGIN)
+    )
+
+    docs = [d for d, _ in docs_scores]
+    if HYBRID_RETRIEVAL and docs:
+        # Merge dense and lexical candidates; the fused list is better ranked,
+        # so fewer candidates need to go through the CrossEncoder. BM25 has no
+        # relevance threshold (one shared word is a hit), so an off-topic query
+        # that FAISS rejected stays rejected and gets the general prompt.
+        docs = fuse_rankings([docs, lexical_search(query, vectorstore)])
+
+    if docs and dominant:
+        top = docs_scores[0][0]
+        docs = [top] + [d for d in docs if d is not top]
+    # Each duplicate would cost a CrossEncoder pair and a RERANK_TOP_K slot
+    docs = collapse_duplicates(docs)
+    if HYBRID_RETRIEVAL:
+        docs = docs[:RERANK_CANDIDATES]
+    return docs, dominant
+
+def retrieve(query: str) -> List[Tuple[Any, Optional[float]]]:
+    """
+    Retrieval policy: first-stage candidates (see _candidates), then
+    CrossEncoder rerank down to RERANK_TOP_K. The rerank is skipped when the
+    best FAISS hit is dominant. Returns (doc, rerank score) pairs, score None
+    when reranking was skipped; [] for small talk or when nothing relevant
+    was found.
+    """
+    if is_small_talk(query):
+        return []
+
+    docs, dominant = _candidates(query)
+    if not docs or dominant:
+        return [(d, None) for d in docs[:RERANK_TOP_K]]
+
+    # Rerank and pick top few
+    return rerank_with_scores(query, docs, get_reranker())[:RERANK_TOP_K]
+
+async def retrieve_async(query: str) -> List[Tuple[Any, Optional[float]]]:
+    """Async retrieve: blocking search runs in the bounded executor."""
+    if is_small_talk(query):
+        return []
+
+    docs, dominant = await run_blocking(_candidates, query)
+    if not docs or dominant:
+        return [(d, None) for d in docs[:RERANK_TOP_K]]
+
+    reranker_model = await run_blocking(get_reranker)
+    return (await rerank_with_scores_async(query, docs, reranker_model))[:RERANK_TOP_K]
+
+REGISTRY.help["dost_prompt_tokens"] = "Estimated prompt tokens sent to the LLM"
+
+def _prompt_for(query: str, scored_docs: List[Tuple[Any, Optional[float]]],
+                history: str = "") -> Tuple[str, Optional[str], List[Dict[str, Any]]]:
+    question = f"{query}\n(Earlier questions from this client: {history})" if history else query
+    if not scored_docs:
         # If retrieval finds nothing useful, fall back to a general
         # assistant-style reply instead of a hard refusal so that
         # greetings and broad questions still get a helpful answer.
-        general_prompt = f"""You are DOST Region II's helpful AI assistant.
-Respond conversationally and briefly to the user message below.
-- If it is a greeting (like "hi", "hello", or "how are you"), greet the user back naturally without mentioning Evidence or Sources.
-- If it asks generally about DOST Region II services or programs,
-  describe the types of support DOST offices typically provide in
-  the Philippines (e.g., science and technology programs, testing
-  and calibration services, scholarships, etc.) and suggest that
-  the user contact DOST Region II directly for specific, updated details.
+        prompt, context, sources = GENERAL_PROMPT_TEXT.format(query=question), None, []
+    else:
+        docs = [d for d, _ in scored_docs]
+        scores = [s for _, s in scored_docs]
+        context, sources = build_context(docs, query, None if None in scores else scores)
+        prompt = PROMPT.format(context=context, question=question)
 
-Respond naturally and conversationally. Do NOT include "Answer:", "Evidence:", or "Sources:" sections.
+    tokens = estimate_tokens(prompt)
+    REGISTRY.observe("dost_prompt_tokens", "kind", "general" if context is None else "rag", tokens)
+    logger.info(f"Prompt: ~{tokens} tokens ({len(sources)} source(s))")
+    return prompt, context, sources
 
-User message: {query}
-Assistant:"""
-        answer = llm.invoke(general_prompt)
-        answer = format_money_and_units(answer)
-        return answer, []
+@timed("retrieve")
+def _build_prompt(query: str) -> Tuple[str, Optional[str], List[Dict[str, Any]]]:
+    """
+    Retrieve context for query and build the LLM prompt.
+    Returns (prompt, context, sources); context is None when retrieval found
+    nothing and the general assistant prompt is used instead.
+    """
+    return _prompt_for(query, retrieve(query))
 
-    # Rerank and pick top few
-    docs = [d for d, _ in docs_scores]
-    docs = rerank(query, docs, reranker_model)[:RERANK_TOP_K]
+async def _build_prompt_async(query: str) -> Tuple[str, Optional[str], List[Dict[str, Any]]]:
+    with timed("retrieve"):
+        scored_docs = await retrieve_async(query)
+    return _prompt_for(query, scored_docs)
 
-    context, sources = build_context(docs)
-    answer = llm.invoke(PROMPT.format(context=context, question=query))
+def _postprocess(raw: str, context: Optional[str]) -> str:
     # Clean up the answer to remove structured sections and "Not applicable" text
-    answer = clean_answer(answer)
-    answer = format_money_and_units(answer)
+    with timed("clean_answer"):
+        return AnswerCleaner(structured=context is not None).feed(raw, partial=False)
+
+def _finish(cleaner: AnswerCleaner) -> str:
+    with timed("clean_answer"):
+        return cleaner.feed("", partial=False)
 
-    if ENABLE_VERIFY:
+def _verify(llm, context: Optional[str], answer: str) -> bool:
+    if not ENABLE_VERIFY or context is None:
+        return True
+    with timed("llm_verify"):
         verdict = llm.invoke(VERIFY_TEXT.format(context=context, answer=answer)).strip().upper()
-        if "UNSUPPORTED" in verdict:
-            return "I don't have enough information to answer that.", sources
+    return "UNSUPPORTED" not in verdict
+
+async def _verify_async(llm, context: Optional[str], answer: str) -> bool:
+    if not ENABLE_VERIFY or context is None:
+        return True
+    with timed("llm_verify"):
+        verdict = (await llm.ainvoke(VERIFY_TEXT.format(context=context, answer=answer))).strip().upper()
+    return "UNSUPPORTED" not in verdict
+
+def rag_answer(query: str, scored_docs: Optional[List] = None, history: str = "") -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Answer query from retrieved context. scored_docs (from retrieve) skips
+    retrieval; history lists earlier questions in the chat.
+    Raises GenerationOverloaded when admission control refuses the LLM call.
+    """
+    llm = get_llm()
+    if scored_docs is None:
+        prompt, context, sources = _build_prompt(query)
+    else:
+        prompt, context, sources = _prompt_for(query, scored_docs, history)
+    with llm_gate.slot():
+        with timed("llm_generate"):
+            raw = llm.invoke(prompt)
+        answer = _postprocess(raw, context)
+        verified = _verify(llm, context, answer)
+
+    if not verified:
+        return UNSUPPORTED_ANSWER, sources
 
     return answer, sources
+
+def rag_answer_stream(query: str, scored_docs: Optional[List] = None,
+                      history: str = "") -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Streaming variant of rag_answer built on OllamaClient.stream.
+    Yields (answer_so_far, sources) as tokens arrive; the last item is the
+    final cleaned answer (replaced by the refusal if verification fails).
+    Raises GenerationOverloaded before the first item when admission
+    control refuses the LLM call.
+    """
+    llm = get_llm()
+    if scored_docs is None:
+        prompt, context, sources = _build_prompt(query)
+    else:
+        prompt, context, sources = _prompt_for(query, scored_docs, history)
+
+    cleaner = AnswerCleaner(structured=context is not None)
+    with llm_gate.slot():
+        with timed("llm_generate"):
+            for chunk in llm.stream(prompt):
+                partial = cleaner.feed(chunk)
+                if partial:
+                    yield partial, sources
+
+        answer = _finish(cleaner)
+        if not _verify(llm, context, answer):
+            answer = UNSUPPORTED_ANSWER
+    yield answer, sources
+
+async def rag_answer_async(query: str, scored_docs: Optional[List] = None,
+                           history: str = "") -> Tuple[str, List[Dict[str, Any]]]:
+    """Async rag_answer: uses OllamaClient.ainvoke and the bounded executor."""
+    llm = get_llm()
+    if scored_docs is None:
+        prompt, context, sources = await _build_prompt_async(query)
+    else:
+        prompt, context, sources = _prompt_for(query, scored_docs, history)
+    async with llm_gate.slot_async():
+        with timed("llm_generate"):
+            raw = await llm.ainvoke(prompt)
+        answer = _postprocess(raw, context)
+        verified = await _verify_async(llm, context, answer)
+
+    if not verified:
+        return UNSUPPORTED_ANSWER, sources
+
+    return answer, sources
+
+async def rag_answer_stream_async(query: str, scored_docs: Optional[List] = None,
+                                  history: str = "") -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Async rag_answer_stream built on OllamaClient.astream."""
+    llm = get_llm()
+    if scored_docs is None:
+        prompt, context, sources = await _build_prompt_async(query)
+    else:
+        prompt, context, sources = _prompt_for(query, scored_docs, history)
+
+    cleaner = AnswerCleaner(structured=context is not None)
+    async with llm_gate.slot_async():
+        with timed("llm_generate"):
+            async for chunk in llm.astream(prompt):
+                partial = cleaner.feed(chunk)
+                if partial:
+                    yield partial, sources
+
+        answer = _finish(cleaner)
+        if not await _verify_async(llm, context, answer):
+            answer = UNSUPPORTED_ANSWER
+    yield answer, sources
@@ -0,0 +1,103 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+
+class RerankScheduler:
+    """
+    Collects (query, passage) pairs from concurrent callers and scores them
+    with one batched predict call. A batch is closed max_wait seconds after
+    its first request arrives, or as soon as it holds max_batch pairs; each
+    caller blocks until its own scores are ready.
+    """
+
+    def __init__(self, predict: Callable[[List[Pair]], Sequence[float]],
+                 max_batch: int, max_wait: float):
+        self._predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.pairs_scored = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting for the next batch."""
+        return self._queue.qsize()
+
+    def submit(self, pairs: List[Pair]) -> Future:
+        """Queue pairs for the next batch; the future resolves to their scores."""
+        fut = Future()
+        if not pairs:
+            fut.set_result([])
+            return fut
+        self._ensure_started()
+        self._queue.put((pairs, fut))
+        return fut
+
+    def score(self, pairs: List[Pair]) -> List[float]:
+        return self.submit(pairs).result()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rerank-scheduler", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[List[Pair], Future]]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    @staticmethod
+    def _resolve(fut: Future, result=None, error: Optional[BaseException] = None) -> None:
+        # One broken waiter must not stop the scheduler thread
+        try:
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+        except InvalidStateError:
+            logger.warning("Rerank result dropped: its future was already resolved")
+
+    def _run(self) -> None:
+        while True:
+            # Requests cancelled while queued are dropped; the rest can no
+            # longer be cancelled once marked running.
+            batch = [(pairs, fut) for pairs, fut in self._collect() if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            all_pairs = [p for pairs, _ in batch for p in pairs]
+            try:
+                scores = list(self._predict(all_pairs))
+            except Exception as e:
+                logger.exception("Batched rerank failed")
+                for _, fut in batch:
+                    self._resolve(fut, error=e)
+                continue
+
+            self.batches += 1
+            self.pairs_scored += len(all_pairs)
+            offset = 0
+            for pairs, fut in batch:
+                self._resolve(fut, scores[offset:offset + len(pairs)])
+                offset += len(pairs)
@@ -1,10 +1,28 @@
-from typing import Tuple, List, Dict, Any
+import logging
+import threading
+import time
+from typing import Tuple, List, Dict, Any, Iterator, AsyncIterator, Optional
 from pathlib import Path
 
-from src.official_store import load_official, answer_official
-from src.rag_engine import rag_answer
+from src.official_store import OfficialStore, answer_official
+from src.rag_engine import (
+    rag_answer, rag_answer_stream, rag_answer_async, rag_answer_stream_async, run_blocking,
+    retrieve, retrieve_async,
+)
+from src.conversation import Conversation, Turn
 from src.formatters import format_sources
-from config import OFFICIAL_DIR
+from src.answer_cache import SemanticAnswerCache, files_fingerprint
+from src.text_index import compile_keywords
+from src.model_cache import get_embeddings, get_precomputed, llm_gate
+from src.generation_gate import GenerationOverloaded
+from src.metrics import REGISTRY, record_request, register_gauge, requests_in_flight, timed
+from src.vector_index import current_index_dir
+from config import (
+    OFFICIAL_DIR, OFFICIAL_RELOAD_INTERVAL, INDEX_DIR,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_MIN_SIM, ANSWER_CACHE_SHED_SIM,
+)
+
+logger = logging.getLogger(__name__)
 
 HIGH_RISK_KEYWORDS = [
     "fee", "fees", "cost", "price", "how much", "rate",
@@ -13,67 +31,328 @@ HIGH_RISK_KEYWORDS = [
     "requirement", "requirements", "documents needed",
     "procedure", "process", "steps", "apply"
 ]
+# Whole-word matching, so "rate" no longer fires on "accurate"
+HIGH_RISK_PATTERN = compile_keywords(HIGH_RISK_KEYWORDS)
+
+# Served (with official contacts when available) when the LLM is overloaded
+# and neither the cache nor the official store can answer.
+BUSY_ANSWER = (
+    "We're receiving a lot of questions right now, so I can't prepare a full answer at the moment. "
+    "Please try again in a minute, or contact DOST Region II directly."
+)
+
+# Official database, loaded once and then kept current by a reload watcher
+_official_store = None
+_official_store_lock = threading.Lock()
+
+def _data_fingerprint():
+    # Any rebuild of the FAISS index changes this value and drops every cached
+    # answer; official data reloads clear the cache directly (get_official_db).
+    live = current_index_dir(INDEX_DIR)
+    return files_fingerprint([live / "index.faiss", live / "chunks.json", live / "index.pkl"])
+
+# Near-duplicate RAG questions are answered from here without touching
+# FAISS, the reranker or the LLM.
+answer_cache = SemanticAnswerCache(
+    embed=lambda q: get_embeddings().embed_query(q),
+    fingerprint=_data_fingerprint,
+    max_size=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    min_similarity=ANSWER_CACHE_MIN_SIM,
+)
 
-# Cache the official database - load once, reuse forever
-_official_db_cache = None
+def _cache_hit_rate() -> float:
+    lookups = answer_cache.hits + answer_cache.misses
+    return answer_cache.hits / lookups if lookups else 0.0
+
+REGISTRY.help["dost_answer_cache_lookups_total"] = "Semantic answer cache lookups by result"
+register_gauge("dost_answer_cache_hit_ratio", "Share of answer cache lookups that hit", _cache_hit_rate)
+register_gauge("dost_answer_cache_entries", "Answers currently cached", lambda: len(answer_cache))
 
 def route_query(query: str) -> str:
-    q = query.lower()
-    return "official" if any(k in q for k in HIGH_RISK_KEYWORDS) else "rag"
+    return "official" if HIGH_RISK_PATTERN.search(query) else "rag"
+
+def get_official_db() -> Dict[str, Dict[str, Any]]:
+    """
+    Current official DB. Loaded on first call; edits to the JSON files are
+    picked up in the background (see OfficialStore) and clear the answer cache.
+    """
+    global _official_store
+    if _official_store is None:
+        with _official_store_lock:
+            if _official_store is None:
+                store = OfficialStore(OFFICIAL_DIR, OFFICIAL_RELOAD_INTERVAL)
+                store.on_change(answer_cache.clear)
+                store.start_watcher()
+                _official_store = store
+    return _official_store.db
+
+def _official_answer(query: str, route: str) -> Optional[str]:
+    """
+    Answer high-risk queries from the official DB. Returns None when the
+    query should go to RAG instead (not high-risk, or not found in the
+    official DB; records still holding placeholder data are never loaded).
+    """
+    if route != "official":
+        return None
+
+    ans, sources = answer_official(get_official_db(), query)
+    if not ans:
+        return None
+    return ans + "\n" + format_sources(sources)
+
+def _precomputed_answer(query: str) -> Optional[str]:
+    # FAQ / quick-card answers prepared by build_index.py
+    return get_precomputed().match(query)
+
+def _cached_answer(query: str):
+    cached, vec = answer_cache.get(query)
+    REGISTRY.inc("dost_answer_cache_lookups_total", "result", "hit" if cached is not None else "miss")
+    return cached, vec
+
+def _shed_answer(query: str) -> str:
+    """
+    Fast answer when admission control refuses an LLM call: a looser cache
+    match, then any official-store match, then BUSY_ANSWER plus contacts.
+    """
+    cached, _ = answer_cache.get(query, min_similarity=ANSWER_CACHE_SHED_SIM)
+    if cached is not None:
+        return cached
+    official = _official_answer(query, "official")
+    if official is not None:
+        return official
+    contacts = _official_answer("contact", "official")
+    return BUSY_ANSWER + ("\n\n" + contacts if contacts else "")
+
+REGISTRY.help["dost_follow_up_turns_total"] = "Follow-up questions by retrieval: previous chunks reused or searched again"
 
-def is_placeholder_data(answer: str) -> bool:
+def _grounding(turn: Optional[Turn]) -> Tuple[Optional[List], str]:
     """
-    Check if the answer contains placeholder data that should trigger
-    a fallback to RAG instead.
+    (scored docs, history) for rag_answer. Without a conversation both are
+    left to rag_answer; a follow-up on the same topic reuses the previous
+    turn's chunks instead of another FAISS + rerank pass.
     """
-    if not answer:
-        return False
-    
-    placeholder_indicators = [
-        "REPLACE_ME",
-        "Step 1",
-        "Step 2", 
-        "Step 3",
-        "Doc 1",
-        "Doc 2",
-        "YYYY-MM-DD",
-        "Procedure memo / document title",
-        "Requirements memo / document title"
-    ]
-    
-    answer_upper = answer.upper()
-    for indicator in placeholder_indicators:
-        if indicator.upper() in answer_upper:
-            return True
-    
-    return False
-
-def hybrid_answer(query: str) -> str:
-    global _official_db_cache
-    # Load official DB only once, cache it (much faster!)
-    if _official_db_cache is None:
-        _official_db_cache = load_official(OFFICIAL_DIR)
-    
-    official_db = _official_db_cache
-
-    route = route_query(query)
-
-    # Try official first when high-risk
-    if route == "official":
-        ans, sources = answer_official(official_db, query)
-        # Check if answer contains placeholder data - if so, fall back to RAG
-        if ans and is_placeholder_data(ans):
-            # Placeholder detected, use RAG instead for better answer
-            rag_ans, rag_sources = rag_answer(query)
-            return rag_ans + "\n" + format_sources(rag_sources)
-        
-        if ans:
-            return ans + "\n" + format_sources(sources)
-
-        # if not found in official DB, fallback to RAG (still strict)
-        rag_ans, rag_sources = rag_answer(query)
-        return rag_ans + "\n" + format_sources(rag_sources)
-
-    # non-high-risk -> RAG
-    rag_ans, rag_sources = rag_answer(query)
-    return rag_ans + "\n" + format_sources(rag_sources)
+    if turn is None:
+        return None, ""
+    if turn.reuse is not None:
+        REGISTRY.inc("dost_follow_up_turns_total", "retrieval", "reused")
+        turn.docs = turn.reuse
+    else:
+        if turn.standalone != turn.query:
+            REGISTRY.inc("dost_follow_up_turns_total", "retrieval", "searched")
+        with timed("retrieve"):
+            turn.docs = retrieve(turn.standalone)
+    return turn.docs, turn.history
+
+async def _grounding_async(turn: Optional[Turn]) -> Tuple[Optional[List], str]:
+    if turn is None or turn.reuse is not None:
+        return _grounding(turn)
+    if turn.standalone != turn.query:
+        REGISTRY.inc("dost_follow_up_turns_total", "retrieval", "searched")
+    with timed("retrieve"):
+        turn.docs = await retrieve_async(turn.standalone)
+    return turn.docs, turn.history
+
+def hybrid_answer(query: str, conversation: Optional[Conversation] = None) -> str:
+    """
+    Answer one chat message. With a Conversation, follow-ups are resolved
+    against the previous turns (see src/conversation.py) and the turn is
+    recorded for the next one.
+    """
+    turn = conversation.begin(query) if conversation else None
+    lookup = turn.standalone if turn else query
+    with requests_in_flight:
+        start = time.perf_counter()
+        route = route_query(lookup)
+        try:
+            # Try official first when high-risk
+            official = _official_answer(lookup, route)
+            if official is not None:
+                record_request("official", time.perf_counter() - start)
+                return official
+
+            precomputed = _precomputed_answer(lookup)
+            if precomputed is not None:
+                record_request("precomputed", time.perf_counter() - start)
+                return precomputed
+
+            # non-high-risk, or not found in official DB -> RAG (still strict)
+            route = "fallback-to-rag" if route == "official" else "rag"
+            cached, vec = _cached_answer(lookup)
+            if cached is not None:
+                record_request("cache", time.perf_counter() - start)
+                return cached
+
+            try:
+                if llm_gate.is_saturated():
+                    # Don't spend retrieval work on a request that can't be generated
+                    raise GenerationOverloaded("generation queue is full")
+                rag_ans, rag_sources = rag_answer(query, *_grounding(turn))
+            except GenerationOverloaded as e:
+                logger.warning(f"Shedding load: {e}")
+                record_request("shed", time.perf_counter() - start)
+                return _shed_answer(lookup)
+
+            answer = rag_ans + "\n" + format_sources(rag_sources)
+            answer_cache.put(lookup, answer, vec)
+            record_request(route, time.perf_counter() - start)
+            return answer
+        finally:
+            if conversation:
+                conversation.end(turn)
+
+def hybrid_answer_stream(query: str, conversation: Optional[Conversation] = None) -> Iterator[str]:
+    """
+    Streaming variant of hybrid_answer. Yields the answer text rendered so
+    far; the last item is the complete answer with its sources appended.
+    Time-to-first-token and total latency are logged per request.
+    """
+    turn = conversation.begin(query) if conversation else None
+    lookup = turn.standalone if turn else query
+    with requests_in_flight:
+        start = time.perf_counter()
+        ttft = None
+        route = route_query(lookup)
+        try:
+            official = _official_answer(lookup, route)
+            precomputed = _precomputed_answer(lookup) if official is None else None
+            if official is not None:
+                route = "official"
+                ttft = time.perf_counter() - start
+                yield official
+            elif precomputed is not None:
+                route = "precomputed"
+                ttft = time.perf_counter() - start
+                yield precomputed
+            else:
+                route = "fallback-to-rag" if route == "official" else "rag"
+                cached, vec = _cached_answer(lookup)
+                if cached is not None:
+                    route = "cache"
+                    ttft = time.perf_counter() - start
+                    yield cached
+                else:
+                    answer, sources = "", []
+                    try:
+                        if llm_gate.is_saturated():
+                            raise GenerationOverloaded("generation queue is full")
+                        for answer, sources in rag_answer_stream(query, *_grounding(turn)):
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            yield answer
+                    except GenerationOverloaded as e:
+                        # Raised before the first token, so nothing was shown yet
+                        logger.warning(f"Shedding load: {e}")
+                        route = "shed"
+                        ttft = time.perf_counter() - start
+                        yield _shed_answer(lookup)
+                    else:
+                        final = answer + "\n" + format_sources(sources)
+                        answer_cache.put(lookup, final, vec)
+                        yield final
+        finally:
+            # Also on errors and when the client disconnects mid-stream
+            if conversation:
+                conversation.end(turn)
+            total = time.perf_counter() - start
+            record_request(route, total, ttft or total)
+            logger.info(f"Answered via {route} in {total:.2f}s (time to first token: {(ttft or total):.2f}s)")
+
+async def hybrid_answer_async(query: str, conversation: Optional[Conversation] = None) -> str:
+    """
+    Async hybrid_answer: the official lookup runs inline (sub-millisecond),
+    the cache lookup and retrieval run in the bounded executor and the LLM
+    is awaited, so no thread is held while waiting on Ollama.
+    """
+    turn = conversation.begin(query) if conversation else None
+    lookup = turn.standalone if turn else query
+    with requests_in_flight:
+        start = time.perf_counter()
+        route = route_query(lookup)
+        try:
+            official = _official_answer(lookup, route)
+            if official is not None:
+                record_request("official", time.perf_counter() - start)
+                return official
+
+            # Off the event loop: may load a newly published index
+            precomputed = await run_blocking(_precomputed_answer, lookup)
+            if precomputed is not None:
+                record_request("precomputed", time.perf_counter() - start)
+                return precomputed
+
+            route = "fallback-to-rag" if route == "official" else "rag"
+            cached, vec = await run_blocking(_cached_answer, lookup)
+            if cached is not None:
+                record_request("cache", time.perf_counter() - start)
+                return cached
+
+            try:
+                if llm_gate.is_saturated():
+                    raise GenerationOverloaded("generation queue is full")
+                rag_ans, rag_sources = await rag_answer_async(query, *await _grounding_async(turn))
+            except GenerationOverloaded as e:
+                logger.warning(f"Shedding load: {e}")
+                record_request("shed", time.perf_counter() - start)
+                return await run_blocking(_shed_answer, lookup)
+
+            answer = rag_ans + "\n" + format_sources(rag_sources)
+            # put embeds the query when vec is None (e.g. first answer into an empty cache)
+            await run_blocking(answer_cache.put, lookup, answer, vec)
+            record_request(route, time.perf_counter() - start)
+            return answer
+        finally:
+            if conversation:
+                conversation.end(turn)
+
+async def hybrid_answer_stream_async(query: str, conversation: Optional[Conversation] = None) -> AsyncIterator[str]:
+    """Async variant of hybrid_answer_stream."""
+    turn = conversation.begin(query) if conversation else None
+    lookup = turn.standalone if turn else query
+    with requests_in_flight:
+        start = time.perf_counter()
+        ttft = None
+        route = route_query(lookup)
+        try:
+            official = _official_answer(lookup, route)
+            precomputed = await run_blocking(_precomputed_answer, lookup) if official is None else None
+            if official is not None:
+                route = "official"
+                ttft = time.perf_counter() - start
+                yield official
+            elif precomputed is not None:
+                route = "precomputed"
+                ttft = time.perf_counter() - start
+                yield precomputed
+            else:
+                route = "fallback-to-rag" if route == "official" else "rag"
+                cached, vec = await run_blocking(_cached_answer, lookup)
+                if cached is not None:
+                    route = "cache"
+                    ttft = time.perf_counter() - start
+                    yield cached
+                else:
+                    answer, sources = "", []
+                    try:
+                        if llm_gate.is_saturated():
+                            raise GenerationOverloaded("generation queue is full")
+                        async for answer, sources in rag_answer_stream_async(query, *await _grounding_async(turn)):
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            yield answer
+                    except GenerationOverloaded as e:
+                        logger.warning(f"Shedding load: {e}")
+                        route = "shed"
+                        ttft = time.perf_counter() - start
+                        yield await run_blocking(_shed_answer, lookup)
+                    else:
+                        final = answer + "\n" + format_sources(sources)
+                        await run_blocking(answer_cache.put, lookup, final, vec)
+                        yield final
+        finally:
+            # Also on errors and when the client disconnects mid-stream
+            if conversation:
+                conversation.end(turn)
+            total = time.perf_counter() - start
+            record_request(route, total, ttft or total)
+            logger.info(f"Answered via {route} in {total:.2f}s (time to first token: {(ttft or total):.2f}s)")
@@ -0,0 +1,113 @@
+import re
+import math
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+_TOKEN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it me my of on or
+our the to what when which who why will with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+_SUFFIXES = r"(?:e?s|ing|ed)?"
+
+def _keyword_forms(keyword: str) -> List[str]:
+    # "address(?:e?s|ing|ed)?" plus the spelling changes of -e and -y stems:
+    # "charg(?:ing|ed)", "appl(?:ies|ied)". No e-drop for -ee stems: "fe(?:ed)"
+    # would match "feed"
+    base = r"\s+".join(map(re.escape, keyword.lower().split()))
+    forms = [base + _SUFFIXES]
+    if keyword.endswith("e") and not keyword.endswith("ee"):
+        forms.append(base[:-1] + "(?:ing|ed)")
+    elif keyword.endswith("y") and len(keyword) > 2:
+        forms.append(base[:-1] + "(?:ies|ied)")
+    return forms
+
+def compile_keywords(keywords: Iterable[str]) -> "re.Pattern":
+    """
+    One case-insensitive regex matching any keyword as whole words, with
+    plural and verb endings ("address" matches "addresses", "process"
+    matches "processing", "apply" matches "applying" and "applied", "fee"
+    matches "fees" but not "coffee"). Spaces in multi-word keywords match
+    any run of whitespace.
+    """
+    alts = sorted({form for k in keywords for form in _keyword_forms(k)}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alts) + r")\b", re.IGNORECASE)
+
+def _trie_regex(node: Dict) -> str:
+    alts = [re.escape(ch) + _trie_regex(child) for ch, child in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    if "" in node:
+        # A phrase ends here and longer ones continue: greedy optional suffix
+        body = (body if len(alts) == 1 and len(alts[0]) == 1 else "(?:" + body + ")") + "?"
+    return body
+
+def compile_phrases(phrases: Iterable[str]) -> "re.Pattern":
+    """
+    One case-insensitive regex matching any of the literal phrases, longest
+    first. The phrases are factored into a trie ("from the (?:context|faqs?)")
+    so the regex engine does a single scan with little backtracking; a flat
+    alternation of the phrases is several times slower per call.
+    """
+    trie: Dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase.lower():
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    return re.compile(_trie_regex(trie), re.IGNORECASE)
+
+class BM25Index:
+    """
+    Token-level inverted index with BM25 scoring over a fixed list of texts.
+    search() returns (doc position, score) pairs, best first.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_len = []
+        self.postings = defaultdict(list)  # token -> [(doc, term frequency)]
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            self.doc_len.append(len(tokens))
+            for tok, tf in Counter(tokens).items():
+                self.postings[tok].append((i, tf))
+        self.n_docs = len(self.doc_len)
+        self.avg_len = (sum(self.doc_len) / self.n_docs) if self.n_docs else 0.0
+
+    def to_dict(self) -> Dict:
+        return {"k1": self.k1, "b": self.b, "doc_len": self.doc_len,
+                "postings": {tok: [list(p) for p in plist] for tok, plist in self.postings.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BM25Index":
+        index = cls([], k1=data["k1"], b=data["b"])
+        index.doc_len = data["doc_len"]
+        index.postings = defaultdict(list, {tok: [tuple(p) for p in plist] for tok, plist in data["postings"].items()})
+        index.n_docs = len(index.doc_len)
+        index.avg_len = (sum(index.doc_len) / index.n_docs) if index.n_docs else 0.0
+        return index
+
+    def idf(self, token: str) -> float:
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, tokens: Iterable[str], limit: int = 5) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = defaultdict(float)
+        for tok in set(tokens):
+            postings = self.postings.get(tok)
+            if not postings:
+                continue
+            idf = self.idf(tok)
+            for doc, tf in postings:
+                norm = 1 - self.b + self.b * self.doc_len[doc] / (self.avg_len or 1)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:limit]
@@ -0,0 +1,173 @@
+import os
+import math
+import time
+import shutil
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from config import FAISS_NPROBE, FAISS_HNSW_EF_SEARCH, INDEX_KEEP_VERSIONS
+from src.chunk_store import ChunkStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.faiss"
+
+# Each build goes into a fresh version directory under the index dir; this
+# file names the live one. Replacing it (os.replace) is the atomic swap that
+# running workers pick up, see model_cache._current_index.
+CURRENT_NAME = "CURRENT"
+# Files of an unversioned index written straight into the index dir
+LEGACY_FILES = ("index.faiss", "index.pkl", "chunks.bin", "chunks.offsets.npy", "chunks.json",
+                "bm25.json", "manifest.json")
+
+# faiss.index_factory specs; {nlist} and {m} are filled in from the corpus size
+INDEX_TYPES = {
+    "flat": "Flat",
+    "hnsw": "HNSW32",
+    "sq8": "SQ8",
+    "ivf": "IVF{nlist},Flat",
+    "ivfsq8": "IVF{nlist},SQ8",
+    "ivfpq": "IVF{nlist},PQ{m}",
+}
+# What to build instead when the corpus is too small to train a type
+FALLBACK = {"ivfpq": "ivfsq8", "ivfsq8": "sq8", "ivf": "flat"}
+
+def _spec(index_type: str, n: int, dim: int) -> Optional[str]:
+    """index_factory spec for n vectors, or None if n is too small to train it."""
+    spec = INDEX_TYPES[index_type]
+    if "IVF" in spec:
+        # ~39 training points per centroid is the faiss minimum
+        nlist = min(int(4 * math.sqrt(n)), n // 39)
+        if nlist < 4:
+            return None
+        spec = spec.replace("{nlist}", str(nlist))
+    if "PQ" in spec:
+        # 256 centroids per sub-quantizer need ~39 * 256 training points;
+        # 8 dims per sub-quantizer
+        if n < 39 * 256 or dim % 8:
+            return None
+        spec = spec.replace("{m}", str(dim // 8))
+    return spec
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = "flat") -> faiss.Index:
+    """Build (train + add) a FAISS index of index_type over L2-normalized vectors."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type} (choose from {', '.join(INDEX_TYPES)})")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    spec = _spec(index_type, n, dim)
+    while spec is None:
+        fallback = FALLBACK[index_type]
+        logger.warning(f"{n} vectors are too few to train a {index_type} index; using {fallback}")
+        index_type = fallback
+        spec = _spec(index_type, n, dim)
+
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index)
+    logger.info(f"Built FAISS {spec} index over {n} vectors")
+    return index
+
+def apply_search_params(index: faiss.Index) -> None:
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", FAISS_NPROBE), ("efSearch", FAISS_HNSW_EF_SEARCH)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # parameter does not apply to this index type
+
+def save_faiss_index(index: faiss.Index, index_dir: Path) -> None:
+    tmp = index_dir / (INDEX_NAME + ".tmp")
+    faiss.write_index(index, str(tmp))
+    os.replace(tmp, index_dir / INDEX_NAME)
+
+def load_faiss_index(index_dir: Path) -> faiss.Index:
+    """
+    Read index.faiss memory-mapped, so the vectors live in the page cache and
+    every worker process shares one copy instead of holding its own.
+    """
+    path = str(index_dir / INDEX_NAME)
+    # IO_FLAG_MMAP_IFC (faiss >= 1.9) also maps flat/SQ/PQ/HNSW codes;
+    # IO_FLAG_MMAP alone only maps IVF lists.
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        index = faiss.read_index(path, flags)
+    except RuntimeError:
+        index = faiss.read_index(path)
+    apply_search_params(index)
+    return index
+
+def current_index_dir(index_dir: Path) -> Path:
+    """Directory holding the live index: the published version, else index_dir itself."""
+    try:
+        return index_dir / (index_dir / CURRENT_NAME).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return index_dir
+
+def new_version_dir(index_dir: Path) -> Path:
+    path = index_dir / f"v{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    path.mkdir(parents=True)
+    return path
+
+def publish_version(index_dir: Path, version_dir: Path, keep: int = INDEX_KEEP_VERSIONS) -> None:
+    """
+    Make version_dir the live index, then delete all but the newest keep
+    versions. Workers still reading a deleted version keep their mappings
+    (the files stay alive until unmapped) and move over on their next check.
+    """
+    tmp = index_dir / (CURRENT_NAME + ".tmp")
+    tmp.write_text(version_dir.name, encoding="utf-8")
+    os.replace(tmp, index_dir / CURRENT_NAME)
+
+    for name in LEGACY_FILES:
+        (index_dir / name).unlink(missing_ok=True)
+    versions = sorted((p for p in index_dir.iterdir() if p.is_dir() and p.name.startswith("v")),
+                      key=lambda p: p.stat().st_mtime)
+    for old in versions[:-keep]:
+        if old != version_dir:
+            shutil.rmtree(old, ignore_errors=True)
+
+def open_vectorstore(index_dir: Path, embeddings) -> FAISS:
+    """
+    LangChain FAISS vectorstore over index.faiss and the chunk store, without
+    unpickling anything: the docstore is a memory-mapped ChunkStore.
+    """
+    store = ChunkStore(index_dir)
+    index = load_faiss_index(index_dir)
+    if index.ntotal != len(store):
+        raise ValueError(f"{index_dir}: index has {index.ntotal} vectors but the chunk store has {len(store)}")
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=store,
+        index_to_docstore_id=dict(enumerate(store.ids)),
+    )
+
+def evaluate_index(index: faiss.Index, base: np.ndarray, queries: np.ndarray, k: int = 6) -> Dict[str, float]:
+    """
+    recall@k of index against exact search over base, and mean per-query
+    search latency in milliseconds.
+    """
+    base = np.ascontiguousarray(base, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(base))
+    exact = faiss.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    found = []
+    start = time.perf_counter()
+    for q in queries:
+        _, ids = index.search(q[None, :], k)
+        found.append(ids[0])
+    elapsed = time.perf_counter() - start
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]) if len(queries) else 0.0
+    return {"recall": float(recall), "latency_ms": 1000 * elapsed / max(1, len(queries))}
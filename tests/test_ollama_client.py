@@ -0,0 +1,148 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.ollama_client import OllamaClient, OllamaError
+
+TOKENS = ["Answer:", " hel", "lo"]
+
+class FakeOllama(BaseHTTPRequestHandler):
+    """Minimal /api/generate: a JSON reply, or an NDJSON stream of TOKENS."""
+    protocol_version = "HTTP/1.1"
+    fail = 0          # answer this many requests with a 503 first
+    drop = False      # close the connection after the first streamed token
+    delay = 0.0       # seconds before answering
+    requests = []     # (client address, payload)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, body):
+        line = (json.dumps(body) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeOllama.requests.append((self.client_address, payload))
+        time.sleep(FakeOllama.delay)
+        if FakeOllama.fail:
+            FakeOllama.fail -= 1
+            return self._send(503, {"error": "model is loading"})
+        if not payload["stream"]:
+            return self._send(200, {"response": "Answer: hello" if "prompt" in payload else "", "done": True})
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(TOKENS):
+            if FakeOllama.drop and i == 1:
+                self.connection.shutdown(socket.SHUT_RDWR)
+                self.close_connection = True
+                return
+            self._chunk({"response": token, "done": False})
+        self._chunk({"response": "", "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+def _serve(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+@pytest.fixture(autouse=True)
+def reset():
+    FakeOllama.fail, FakeOllama.drop, FakeOllama.delay = 0, False, 0.0
+    FakeOllama.requests = []
+
+@pytest.fixture
+def server():
+    server = _serve()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _client(server, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return OllamaClient(f"http://127.0.0.1:{server.server_address[1]}", "mistral",
+                        options={"num_ctx": 2048, "num_thread": 4}, **kwargs)
+
+def test_requests_reuse_one_connection(server):
+    client = _client(server)
+    assert client.invoke("hi") == "Answer: hello"
+    assert "".join(client.stream("hi")) == "Answer: hello"
+    client.invoke("hi")
+    assert len({address for address, _ in FakeOllama.requests}) == 1
+
+def test_warm_sends_the_generation_options(server):
+    _client(server).warm()
+    payload = FakeOllama.requests[0][1]
+    assert "prompt" not in payload
+    assert payload["options"] == {"num_ctx": 2048, "num_thread": 4}
+
+def test_server_error_is_retried(server):
+    FakeOllama.fail = 2
+    assert _client(server, retries=2).invoke("hi") == "Answer: hello"
+    assert len(FakeOllama.requests) == 3
+
+def test_gives_up_after_the_last_retry(server):
+    FakeOllama.fail = 3
+    with pytest.raises(OllamaError):
+        _client(server, retries=2).invoke("hi")
+    assert len(FakeOllama.requests) == 3
+
+def test_connection_refused_is_retried():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    client = OllamaClient(f"http://127.0.0.1:{port}", "mistral", retries=3, backoff=0.2)
+    servers = []
+    starter = threading.Timer(0.1, lambda: servers.append(_serve(port)))
+    starter.start()
+    try:
+        assert "".join(client.stream("hi")) == "Answer: hello"
+    finally:
+        starter.join()
+        for s in servers:
+            s.shutdown()
+            s.server_close()
+
+def test_stream_is_not_retried_after_the_first_token(server):
+    FakeOllama.drop = True
+    tokens = []
+    with pytest.raises(OllamaError):
+        for token in _client(server, retries=2).stream("hi"):
+            tokens.append(token)
+    assert tokens == TOKENS[:1]
+    assert len(FakeOllama.requests) == 1
+
+def test_read_timeout_is_not_retried(server):
+    FakeOllama.delay = 0.5
+    with pytest.raises(OllamaError):
+        _client(server, retries=2, timeout=0.1).invoke("hi")
+    assert len(FakeOllama.requests) == 1
+
+def _pings():
+    return [payload for _, payload in FakeOllama.requests if "prompt" not in payload]
+
+def test_keep_warm_pings_only_when_idle(server):
+    client = _client(server)
+    client.start_keep_warm(1.0)
+    # Traffic more often than the interval: no ping
+    for _ in range(6):
+        client.invoke("hi")
+        time.sleep(0.25)
+    assert _pings() == []
+    # Idle: pinged within about two intervals (the loop sleeps at least 1s)
+    time.sleep(2.5)
+    assert len(_pings()) >= 1
@@ -0,0 +1,34 @@
+import pytest
+
+from src.precomputed import PrecomputedAnswers
+
+ENTRIES = [
+    {"question": "What types of microbiological tests are available?", "answer": "micro"},
+    {"question": "What types of chemical tests are available?", "answer": "chemical"},
+    {"question": "How do I submit a sample?", "answer": "submit"},
+]
+
+@pytest.fixture
+def answers():
+    return PrecomputedAnswers(ENTRIES, min_overlap=0.75)
+
+@pytest.mark.parametrize("query, expected", [
+    ("what types of microbiological tests are available", "micro"),
+    ("Which types of microbiological tests are available?", "micro"),
+    ("What types of chemical tests are available in Tuguegarao?", "chemical"),
+    ("How do I submit a sample?", "submit"),
+])
+def test_matches_the_stored_question(answers, query, expected):
+    assert answers.match(query) == expected
+
+@pytest.mark.parametrize("query", [
+    # Drops a qualifier: broader than either stored question
+    "What types of tests are available?",
+    "What tests are available?",
+    "How do I submit?",
+    # Adds too much to the stored question
+    "What types of chemical tests are available for water and soil samples?",
+    "What are your office hours?",
+])
+def test_near_misses_are_left_to_retrieval(answers, query):
+    assert answers.match(query) is None
@@ -0,0 +1,32 @@
+import pytest
+
+from src.text_index import compile_keywords
+
+PATTERN = compile_keywords(["fee", "address", "process", "apply", "charge", "how much", "rate"])
+
+@pytest.mark.parametrize("text", [
+    "What is the fee?",
+    "Are there fees?",
+    "List your addresses",
+    "What processes do you follow?",
+    "How long is processing?",
+    "I am applying for SETUP",
+    "Who applies for it?",
+    "I applied last week",
+    "Is this charged?",
+    "Are you charging for samples?",
+    "How   much is it?",
+])
+def test_keyword_forms_match(text):
+    assert PATTERN.search(text)
+
+@pytest.mark.parametrize("text", [
+    "Do you sell coffee?",
+    "Is the result accurate?",
+    "Tell me about the processor",
+    "Send me a reapplication form",
+    "Do you test animal feed?",
+    "Which feeds can you analyze?",
+])
+def test_keywords_match_whole_words_only(text):
+    assert not PATTERN.search(text)